@@ -1,6 +1,74 @@
+from sqlalchemy import BigInteger, cast, func, inspect, text, update
 from database import engine, Base
 import models
 
-print("Création des tables dans mortgage_app.db...")
-Base.metadata.create_all(bind=engine)
-print("Base de données prête !")
+
+def ajouter_colonnes_manquantes():
+    """
+    Migration légère : ajoute aux tables existantes les colonnes déclarées
+    dans models.py mais absentes en base (create_all ne modifie pas une table).
+    """
+    inspecteur = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspecteur.has_table(table.name):
+                continue
+            existantes = {c["name"] for c in inspecteur.get_columns(table.name)}
+            for colonne in table.columns:
+                if colonne.name not in existantes:
+                    type_sql = colonne.type.compile(dialect=engine.dialect)
+                    conn.execute(text(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN "{colonne.name}" {type_sql}'))
+
+
+def ajouter_index_manquants():
+    """Crée les index déclarés dans models.py mais absents des tables existantes."""
+    inspecteur = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspecteur.has_table(table.name):
+            continue
+        existants = {i["name"] for i in inspecteur.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existants:
+                index.create(bind=engine)
+
+
+# Colonnes en centimes et colonne en euros dont elles sont issues
+COLONNES_CENTIMES = (
+    ("mensualite_centimes", "mensualite"),
+    ("interet_centimes", "interet"),
+    ("assurance_centimes", "assurance"),
+    ("capital_amorti_centimes", "capital_amorti"),
+    ("solde_restant_centimes", "solde_restant"),
+)
+
+
+def remplir_centimes_manquants():
+    """
+    Reprise des lignes de détail antérieures aux colonnes en centimes : les
+    montants enregistrés étant au centime, ROUND(montant * 100) est exact.
+    """
+    table = models.SimulationDetail.__table__
+    with engine.begin() as conn:
+        for centimes, euros in COLONNES_CENTIMES:
+            conn.execute(
+                update(table)
+                .where(table.c[centimes].is_(None), table.c[euros].isnot(None))
+                .values({centimes: cast(func.round(table.c[euros] * 100), BigInteger)}))
+
+
+def initialiser_schema():
+    """
+    Crée les tables manquantes, ajoute les colonnes et index manquants puis
+    complète les montants en centimes des lignes existantes.
+    """
+    Base.metadata.create_all(bind=engine)
+    ajouter_colonnes_manquantes()
+    ajouter_index_manquants()
+    remplir_centimes_manquants()
+
+
+if __name__ == "__main__":
+    print("Création des tables dans mortgage_app.db...")
+    initialiser_schema()
+    print("Base de données prête !")
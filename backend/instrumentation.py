@@ -0,0 +1,329 @@
+"""
+Instrumentation des requêtes : étapes chronométrées, requêtes SQL,
+histogrammes de latence au format Prometheus et profileur par échantillonnage.
+"""
+import contextvars
+import functools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# Bornes (en secondes) des histogrammes de latence
+BORNES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+          0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Profilage : activé par en-tête `X-Profilage: 1` si PROFILAGE_ACTIF=1,
+# ou aléatoirement sur une fraction PROFILAGE_TAUX des requêtes.
+PROFILAGE_ACTIF = os.getenv("PROFILAGE_ACTIF") == "1"
+PROFILAGE_TAUX = float(os.getenv("PROFILAGE_TAUX", "0"))
+PROFILAGE_INTERVALLE = 0.001
+
+
+class Histogramme:
+    """Histogramme cumulatif thread-safe, indexé par un tuple d'étiquettes."""
+
+    def __init__(self, nom: str, aide: str, etiquettes: tuple):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = etiquettes
+        self._series = {}
+        self._verrou = threading.Lock()
+
+    def observer(self, valeur: float, *labels):
+        with self._verrou:
+            serie = self._series.setdefault(labels, [[0] * len(BORNES), 0.0, 0])
+            for i, borne in enumerate(BORNES):
+                if valeur <= borne:
+                    serie[0][i] += 1
+            serie[1] += valeur
+            serie[2] += 1
+
+    def exposer(self) -> list:
+        lignes = [f"# HELP {self.nom} {self.aide}", f"# TYPE {self.nom} histogram"]
+        with self._verrou:
+            for labels, (compteurs, somme, total) in sorted(self._series.items()):
+                base = ",".join(f'{k}="{v}"' for k, v in zip(self.etiquettes, labels))
+                sep = "," if base else ""
+                for borne, compteur in zip(BORNES, compteurs):
+                    lignes.append(
+                        f'{self.nom}_bucket{{{base}{sep}le="{borne}"}} {compteur}')
+                lignes.append(f'{self.nom}_bucket{{{base}{sep}le="+Inf"}} {total}')
+                lignes.append(f"{self.nom}_sum{{{base}}} {somme:.6f}")
+                lignes.append(f"{self.nom}_count{{{base}}} {total}")
+        return lignes
+
+
+class Compteur:
+    """Compteur monotone thread-safe, sans étiquettes."""
+
+    def __init__(self, nom: str, aide: str):
+        self.nom = nom
+        self.aide = aide
+        self.valeur = 0
+        self._verrou = threading.Lock()
+
+    def incrementer(self, pas: int = 1):
+        with self._verrou:
+            self.valeur += pas
+
+    def exposer(self) -> list:
+        return [f"# HELP {self.nom} {self.aide}", f"# TYPE {self.nom} counter",
+                f"{self.nom} {self.valeur}"]
+
+
+LATENCE_HTTP = Histogramme(
+    "http_request_duration_seconds", "Durée des requêtes HTTP.",
+    ("methode", "route", "statut"))
+LATENCE_ETAPES = Histogramme(
+    "etape_duration_seconds", "Durée des étapes (calcul, échéancier, base, rendu...).",
+    ("etape",))
+LATENCE_SQL = Histogramme(
+    "sql_query_duration_seconds", "Durée des requêtes SQL.", ("operation",))
+ECRITURES_PERDUES = Compteur(
+    "ecriture_differee_echecs_total",
+    "Simulations dont l'ID a été renvoyé mais que la file n'a pas pu écrire.")
+
+# Mesures de la requête en cours (None hors requête, ex. thread d'écriture)
+_mesures_requete = contextvars.ContextVar("mesures_requete", default=None)
+
+# Profileur de la requête en cours (None si elle n'est pas profilée)
+_profileur_requete = contextvars.ContextVar("profileur_requete", default=None)
+
+# Derniers profils collectés, consultables via /debug/profils
+PROFILS = deque(maxlen=20)
+
+# Ce que couvre un profil : la pile de la boucle d'événements est partagée par
+# toutes les requêtes en cours, celle des threads de travail est propre à la requête.
+PORTEE_PROFIL = ("boucle: boucle d'événements entière (requêtes concurrentes incluses) ; "
+                 "travail: threads du pool exécutant le travail de cette requête")
+
+
+class MesuresRequete:
+    """Étapes et requêtes SQL accumulées pendant une requête HTTP."""
+
+    def __init__(self):
+        self.etapes = []
+        self.nb_sql = 0
+        self.duree_sql = 0.0
+
+    def server_timing(self, total: float) -> str:
+        parties = [f"{nom};dur={duree * 1000:.2f}" for nom, duree in self.etapes]
+        parties.append(f"sql;dur={self.duree_sql * 1000:.2f};desc=\"{self.nb_sql} requetes\"")
+        parties.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parties)
+
+
+@contextmanager
+def etape(nom: str):
+    """Chronomètre un bloc et l'associe à la requête en cours."""
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        duree = time.perf_counter() - debut
+        LATENCE_ETAPES.observer(duree, nom)
+        mesures = _mesures_requete.get()
+        if mesures is not None:
+            mesures.etapes.append((nom, duree))
+
+
+def instrumenter_engine(engine):
+    """Branche le comptage et le chronométrage des requêtes SQL sur l'engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _avant(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("debuts_requetes", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _apres(conn, cursor, statement, parameters, context, executemany):
+        duree = time.perf_counter() - conn.info["debuts_requetes"].pop()
+        operation = statement.lstrip().split(" ", 1)[0].upper()
+        LATENCE_SQL.observer(duree, operation)
+        mesures = _mesures_requete.get()
+        if mesures is not None:
+            mesures.nb_sql += 1
+            mesures.duree_sql += duree
+
+    @event.listens_for(engine, "handle_error")
+    def _erreur(contexte):
+        # Requête en échec : after_cursor_execute n'est pas appelé
+        conn = contexte.connection
+        if conn is not None and conn.info.get("debuts_requetes"):
+            conn.info["debuts_requetes"].pop()
+
+
+class ProfileurEchantillonnage:
+    """
+    Profileur statistique : un thread relève la pile des threads observés
+    toutes les `intervalle` secondes et compte les piles rencontrées.
+
+    Le thread de la boucle d'événements est observé en continu ; les threads
+    du pool y sont ajoutés (`suivre`) le temps d'exécuter le travail de la
+    requête. Chaque pile commence par le rôle du thread : `boucle` ou `travail`.
+    """
+
+    def __init__(self, thread_id: int, intervalle: float = PROFILAGE_INTERVALLE):
+        self._thread_id = thread_id
+        self._intervalle = intervalle
+        self._piles = Counter()
+        self._travail = Counter()
+        self._verrou = threading.Lock()
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, daemon=True)
+
+    def demarrer(self):
+        self._thread.start()
+
+    def suivre(self, thread_id: int):
+        with self._verrou:
+            self._travail[thread_id] += 1
+
+    def oublier(self, thread_id: int):
+        with self._verrou:
+            self._travail[thread_id] -= 1
+            if self._travail[thread_id] <= 0:
+                del self._travail[thread_id]
+
+    def arreter(self) -> dict:
+        self._arret.set()
+        self._thread.join()
+        return {
+            "echantillons": sum(self._piles.values()),
+            # Format "piles repliées" compatible flamegraph.pl / speedscope
+            "piles": [f"{pile} {nb}" for pile, nb in self._piles.most_common(50)]
+        }
+
+    def _boucle(self):
+        while not self._arret.wait(self._intervalle):
+            frames = sys._current_frames()
+            with self._verrou:
+                observes = [(self._thread_id, "boucle")] + [
+                    (thread_id, "travail") for thread_id in self._travail]
+            for thread_id, role in observes:
+                frame = frames.get(thread_id)
+                pile = []
+                while frame is not None:
+                    code = frame.f_code
+                    pile.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if pile:
+                    pile.append(role)
+                    self._piles[";".join(reversed(pile))] += 1
+
+
+@contextmanager
+def thread_de_travail():
+    """Ajoute le thread courant au profil de la requête en cours, s'il y en a un."""
+    profileur = _profileur_requete.get()
+    thread_id = threading.get_ident()
+    if profileur is None or thread_id == profileur._thread_id:
+        yield
+        return
+    profileur.suivre(thread_id)
+    try:
+        yield
+    finally:
+        profileur.oublier(thread_id)
+
+
+def suivi(fonction):
+    """Enveloppe une fonction exécutée dans le pool de threads pour le profilage."""
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        with thread_de_travail():
+            return fonction(*args, **kwargs)
+    return enveloppe
+
+
+def suivre_flux(iterable):
+    """
+    Itère `iterable` en profilant chaque élément dans le thread qui le produit
+    (un flux de StreamingResponse peut changer de thread à chaque lot).
+    """
+    iterateur = iter(iterable)
+    while True:
+        with thread_de_travail():
+            try:
+                element = next(iterateur)
+            except StopIteration:
+                return
+        yield element
+
+
+def profilage_demande(request) -> bool:
+    if PROFILAGE_ACTIF and request.headers.get("x-profilage") == "1":
+        return True
+    return PROFILAGE_TAUX > 0 and random.random() < PROFILAGE_TAUX
+
+
+def _enregistrer_profil(profileur: ProfileurEchantillonnage, chemin: str, debut: float):
+    PROFILS.append({
+        "route": chemin,
+        "duree_s": round(time.perf_counter() - debut, 6),
+        "portee": PORTEE_PROFIL,
+        **profileur.arreter()
+    })
+
+
+def _terminer_requete(request, statut: int, debut: float, profileur):
+    route = request.scope.get("route")
+    chemin = route.path if route is not None else "inconnue"
+    LATENCE_HTTP.observer(
+        time.perf_counter() - debut, request.method, chemin, str(statut))
+    if profileur is not None:
+        _enregistrer_profil(profileur, chemin, debut)
+
+
+async def _suivre_corps(corps, request, statut: int, debut: float, profileur):
+    # Le corps (flux d'export, fichier) est produit après le retour de call_next
+    try:
+        async for morceau in corps:
+            yield morceau
+    finally:
+        _terminer_requete(request, statut, debut, profileur)
+
+
+async def middleware_chronometrage(request, call_next):
+    """
+    Mesure chaque requête jusqu'au dernier octet du corps : histogramme de
+    latence par route, en-tête `Server-Timing` détaillant les étapes (jusqu'à
+    l'envoi des en-têtes) et, sur demande, un profil couvrant la boucle
+    d'événements et les threads de travail de la requête.
+    """
+    mesures = MesuresRequete()
+    jeton = _mesures_requete.set(mesures)
+    profileur = None
+    if profilage_demande(request):
+        profileur = ProfileurEchantillonnage(threading.get_ident())
+        profileur.demarrer()
+    jeton_profileur = _profileur_requete.set(profileur)
+
+    debut = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        _terminer_requete(request, 500, debut, profileur)
+        raise
+    finally:
+        _mesures_requete.reset(jeton)
+        _profileur_requete.reset(jeton_profileur)
+
+    response.headers["Server-Timing"] = mesures.server_timing(
+        time.perf_counter() - debut)
+    response.body_iterator = _suivre_corps(
+        response.body_iterator, request, response.status_code, debut, profileur)
+    return response
+
+
+def exposer_metriques() -> str:
+    """Texte au format d'exposition Prometheus pour l'endpoint /metrics."""
+    lignes = []
+    for metrique in (LATENCE_HTTP, LATENCE_ETAPES, LATENCE_SQL, ECRITURES_PERDUES):
+        lignes.extend(metrique.exposer())
+    return "\n".join(lignes) + "\n"
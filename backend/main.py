@@ -1,30 +1,44 @@
 from fastapi.responses import FileResponse
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict
+from typing import List, Dict, Optional, Union
+from datetime import datetime
 import services
-from schemas import LoanInput  # On suppose que tes classes Pydantic sont là
-import pandas as pd
-import io
+from schemas import LoanInput, ScenarioInput, ComparaisonInput, ExportPdfInput  # On suppose que tes classes Pydantic sont là
 from database import Base
-from starlette.responses import StreamingResponse, FileResponse
+from starlette.responses import StreamingResponse, FileResponse, JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
 import models
+import init_db
 import repository
+import instrumentation
 import os
+from contextlib import asynccontextmanager
+from functools import partial
 
 # Correction de l'URL de la base de données si nécessaire
 db_url = os.getenv("DATABASE_URL")
 if db_url and db_url.startswith("postgres://"):
     db_url = db_url.replace("postgres://", "postgresql://", 1)
 
-# Créer les tables au démarrage
-try:
-    models.Base.metadata.create_all(bind=engine)
-    print("Base de données connectée et tables créées !")
-except Exception as e:
-    print(f"ERREUR CONNEXION DB: {e}")
+# Création du schéma : étape explicite (`python init_db.py`) et non plus à l'import.
+# Au démarrage, seulement par défaut sur le SQLite local (un seul processus) :
+# ailleurs, les workers autoscalés exécuteraient la DDL en concurrence.
+CREER_SCHEMA = os.getenv(
+    "CREER_SCHEMA", "1" if engine.dialect.name == "sqlite" else "0") == "1"
+
+
+def creer_schema():
+    """Crée les tables et colonnes manquantes (données existantes conservées)."""
+    try:
+        init_db.initialiser_schema()
+        print("Base de données connectée et tables créées !")
+    except Exception as e:
+        print(f"ERREUR CONNEXION DB: {e}")
+
+
 # Dépendance pour la base de données
 
 
@@ -36,7 +50,45 @@ def get_db():
         db.close()
 
 
-app = FastAPI()
+# File d'écriture différée des simulations (entête + échéancier).
+# Sur SQLite, ECRITURE_DIFFEREE_SQLITE=1 déclare un processus unique (poste
+# local) : sans cela, les simulations sont enregistrées de façon synchrone.
+file_ecriture = repository.FileEcritureDifferee(
+    SessionLocal, compteur_local=os.getenv("ECRITURE_DIFFEREE_SQLITE") == "1")
+
+
+async def enregistrer_simulation(db: Session, params: dict, echeancier: list,
+                                 client_id: int, operateur_id: int = None) -> int:
+    """Enregistre une simulation via la file d'écriture si possible et retourne son ID."""
+    if not file_ecriture.accepte(db):
+        db_sim = repository.save_simulation(
+            db, params, echeancier, client_id, operateur_id)
+        return db_sim.id if db_sim else None
+
+    sim_id = file_ecriture.reserver_id(db)
+    if not file_ecriture.soumettre(sim_id, params, echeancier, client_id,
+                                   operateur_id, bloquant=False):
+        # File pleine : on attend le thread d'écriture hors de la boucle d'événements
+        await run_in_threadpool(
+            file_ecriture.soumettre, sim_id, params, echeancier, client_id, operateur_id)
+    return sim_id
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if CREER_SCHEMA:
+        creer_schema()
+    file_ecriture.demarrer()
+    yield
+    # Durabilité : tout ce qui est en file est écrit avant l'arrêt du worker
+    file_ecriture.arreter()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Chronométrage par étape, comptage SQL et histogrammes exposés sur /metrics
+instrumentation.instrumenter_engine(engine)
+app.middleware("http")(instrumentation.middleware_chronometrage)
 
 origins = [
     "http://localhost:3000",
@@ -66,15 +118,24 @@ async def calculer_pret(data: LoanInput, db: Session = Depends(get_db)):
     """
     try:
         # 1. Calcul des paramètres financiers
-        m, n, p, t_mensuel = services.resoudre_parametres_pret(
-            data.montant, data.taux_annuel, data.duree_mois, data.mensualite
-        )
+        with instrumentation.etape("calcul"):
+            resoudre = (services.resoudre_parametres_centimes
+                        if data.mode_calcul == "centimes"
+                        else services.resoudre_parametres_pret)
+            m, n, p, t_mensuel = resoudre(
+                data.montant, data.taux_annuel, data.duree_mois, data.mensualite
+            )
 
         if any(v is None for v in [m, n, p]):
             raise ValueError("Informations insuffisantes pour le calcul.")
 
-        echeancier, total_int, total_assu = services.generer_echeancier(
-            m, n, p, t_mensuel)
+        with instrumentation.etape("echeancier"):
+            if data.mode_calcul == "centimes":
+                echeancier, total_int, total_assu = services.generer_echeancier_centimes(
+                    m, n, p, t_mensuel)
+            else:
+                echeancier, total_int, total_assu = services.generer_echeancier(
+                    m, n, p, t_mensuel)
 
         params_finaux = {
             "montant": round(m, 2),
@@ -86,23 +147,23 @@ async def calculer_pret(data: LoanInput, db: Session = Depends(get_db)):
             "cout_total_credit": round(total_int + total_assu, 2)
         }
 
-        # 2. Sauvegarde UNIQUE et récupération de l'ID
-        # On force un client_id à 1 par défaut si data.client_id est absent pour éviter les crashs
-        c_id = data.client_id if data.client_id else 1
+        # 2. Réservation de l'ID puis écriture différée (sauf calcul exploratoire)
+        sim_id = None
+        if data.persist:
+            # On force un client_id à 1 par défaut si data.client_id est absent pour éviter les crashs
+            c_id = data.client_id if data.client_id else 1
 
-        new_sim = repository.save_simulation(
-            db, params_finaux, echeancier, c_id)
+            with instrumentation.etape("base"):
+                sim_id = await enregistrer_simulation(
+                    db, params_finaux, echeancier, c_id, data.operateur_id)
 
-        if not new_sim:
-            raise HTTPException(
-                status_code=500, detail="Erreur lors de la sauvegarde en base.")
-
-        # 3. Réponse propre pour React
-        return {
-            "params_finaux": params_finaux,
-            "echeancier": echeancier,
-            "id": new_sim.id  # L'ID qui servira à l'export Excel
-        }
+        # 3. Réponse propre pour React (sérialisée ici pour être chronométrée)
+        with instrumentation.etape("serialisation"):
+            return JSONResponse({
+                "params_finaux": params_finaux,
+                "echeancier": echeancier,
+                "id": sim_id  # L'ID qui servira à l'export Excel
+            })
 
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
@@ -112,6 +173,86 @@ async def calculer_pret(data: LoanInput, db: Session = Depends(get_db)):
             status_code=500, detail=f"Erreur interne: {str(e)}")
 
 
+@app.post("/simulation/{sim_id}/scenario")
+async def simuler_scenario(sim_id: int, data: ScenarioInput, db: Session = Depends(get_db)):
+    """
+    Rejoue une simulation enregistrée avec des événements "what-if"
+    (remboursement anticipé, renégociation, changement de mensualité ou de durée).
+
+    Seuls les mois postérieurs au premier événement sont recalculés, ce qui
+    permet d'alimenter un curseur interactif côté React.
+
+    Returns:
+        JSON: Échéancier du scénario et écarts d'intérêts et de durée.
+    """
+    # La simulation peut encore être dans la file d'écriture
+    await run_in_threadpool(file_ecriture.attendre, sim_id)
+    sim = db.query(models.Simulation).filter(
+        models.Simulation.id == sim_id).first()
+    if not sim:
+        raise HTTPException(status_code=404, detail="Simulation non trouvée")
+
+    try:
+        # Le préfixe et la référence viennent de l'échéancier enregistré
+        reference = repository.lire_echeancier(db, sim_id)
+        if not reference:
+            raise ValueError("Simulation incomplète, scénario impossible.")
+
+        # Mensualité hors assurance enregistrée, sinon relue sur la 1re échéance
+        p = sim.mensualite or round(
+            reference[0]["capital"] + reference[0]["interet"], 2)
+
+        resultat = services.simuler_scenario(
+            reference, sim.montant_desire, sim.taux_annuel, p,
+            [ev.model_dump() for ev in data.evenements])
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    return {"id": sim_id, **resultat}
+
+
+@app.post("/comparer-offres")
+async def comparer_offres(data: ComparaisonInput, db: Session = Depends(get_db)):
+    """
+    Compare et classe plusieurs offres bancaires en un seul appel.
+
+    Le calcul est vectorisé et sans état : aucun échéancier n'est construit
+    ni enregistré, sauf si `persist` est demandé.
+
+    Returns:
+        JSON: Offres classées avec coût total, TAEG et mensualité assurance incluse.
+    """
+    offres = []
+    for offre in data.offres:
+        montant = offre.montant or data.montant
+        if not montant:
+            raise HTTPException(
+                status_code=400, detail="Montant manquant pour une offre.")
+        offres.append({**offre.model_dump(), "montant": montant})
+
+    try:
+        classement = services.comparer_offres(offres, data.critere)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    if data.persist:
+        c_id = data.client_id if data.client_id else 1
+        for offre in classement:
+            m, n, p, t_mensuel = services.resoudre_parametres_pret(
+                offre["montant"], offre["taux_annuel"], offre["duree_mois"], None)
+            echeancier, total_int, total_assu = services.generer_echeancier(
+                m, n, p, t_mensuel, offre["taux_assurance"])
+            params = {
+                "montant": round(m, 2),
+                "taux_annuel": round(offre["taux_annuel"], 2),
+                "duree_mois": n,
+                "mensualite": round(p, 2)
+            }
+            offre["id"] = await enregistrer_simulation(db, params, echeancier, c_id)
+
+    return {"offres": classement, "critere": data.critere}
+
+
 @app.post("/capacite-emprunt")
 async def calculer_capacite(data: dict):
     """
@@ -165,6 +306,7 @@ async def lire_historique(db: Session = Depends(get_db)):
     Inclut les simulations marquées 'is_deleted' pour gestion côté Frontend.
     """
     # On récupère tout pour permettre au front d'afficher la mention "Supprimé"
+    await run_in_threadpool(file_ecriture.vider)
     simulations = db.query(models.Simulation).all()
 
     resultat = []
@@ -211,6 +353,7 @@ async def supprimer_simulation(sim_id: int, db: Session = Depends(get_db)):
     Effectue une suppression logique (Soft Delete).
     La donnée reste en base mais change d'état (Point 3).
     """
+    await run_in_threadpool(file_ecriture.attendre, sim_id)
     sim = repository.soft_delete_simulation(db, sim_id)
     if not sim:
         raise HTTPException(status_code=404, detail="Simulation non trouvée")
@@ -224,6 +367,7 @@ async def read_stats(db: Session = Depends(get_db)):
     Combine les données de la DB et l'état du Repository de fichiers.
     """
     # Statistiques DB
+    await run_in_threadpool(file_ecriture.vider)
     db_stats = repository.get_dashboard_stats(db)
 
     # Statistiques Fichiers (Point 4)
@@ -246,8 +390,9 @@ async def export_excel(simulation_id: int, data: List[Dict]):
 
     try:
         # Appel au service qui fait la sauvegarde physique
-        chemin_fichier = services.sauvegarder_excel_localement(
-            data, simulation_id)
+        with instrumentation.etape("rendu"):
+            chemin_fichier = services.sauvegarder_excel_localement(
+                data, simulation_id)
 
         return FileResponse(
             path=chemin_fichier,
@@ -259,15 +404,26 @@ async def export_excel(simulation_id: int, data: List[Dict]):
 
 
 @app.post("/export/pdf/{simulation_id}")
-async def export_pdf(simulation_id: int, data: List[Dict]):
+async def export_pdf(simulation_id: int, data: Union[List[Dict], ExportPdfInput]):
     """
     1. Génère et sauvegarde le PDF localement dans /exported_simulations.
     2. Envoie le fichier au client pour téléchargement immédiat.
+
+    Accepte l'échéancier seul ou {echeancier, params_finaux} pour la page de
+    synthèse. Le rendu ReportLab tourne dans le pool de threads pour ne pas
+    bloquer la boucle d'événements.
     """
+    if isinstance(data, ExportPdfInput):
+        echeancier, params_finaux = data.echeancier, data.params_finaux
+    else:
+        echeancier, params_finaux = data, None
+
     try:
         # Appel au service pour la génération et sauvegarde physique
-        chemin_fichier = services.sauvegarder_pdf_localement(
-            data, simulation_id)
+        with instrumentation.etape("rendu"):
+            chemin_fichier = await run_in_threadpool(
+                instrumentation.suivi(services.sauvegarder_pdf_localement),
+                echeancier, simulation_id, params_finaux)
 
         # Incrémenter le compteur dans la base de données (optionnel mais recommandé)
         # simulation = db.query(models.Simulation).filter(models.Simulation.id == simulation_id).first()
@@ -328,9 +484,71 @@ async def export_pdf(simulation_id: int, data: List[Dict]):
 #         raise HTTPException(
 #             status_code=500, detail=f"Erreur lors du stockage : {str(e)}")
 
+FORMATS_EXPORT = {
+    "csv": (services.flux_csv, "text/csv; charset=utf-8"),
+    "ndjson": (services.flux_ndjson, "application/x-ndjson"),
+    "parquet": (services.flux_parquet, "application/vnd.apache.parquet"),
+}
+
+
+@app.get("/export/{table}.{format}")
+async def export_masse(
+        table: str,
+        format: str,
+        date_debut: Optional[datetime] = None,
+        date_fin: Optional[datetime] = None,
+        client_id: Optional[int] = None,
+        operateur_id: Optional[int] = None,
+        inclure_supprimees: bool = False,
+        taille_lot: int = Query(5000, gt=0, le=100000)):
+    """
+    Export en flux des simulations ('simulations') ou de leurs lignes
+    d'échéancier ('details') en CSV, NDJSON ou Parquet (si pyarrow est installé).
+
+    Les lignes sont lues par lots via un curseur côté serveur et envoyées au fil
+    de l'eau : la mémoire du worker reste constante quel que soit le volume.
+    """
+    if table not in ("simulations", "details"):
+        raise HTTPException(status_code=404, detail="Table d'export inconnue")
+    if format not in FORMATS_EXPORT:
+        raise HTTPException(status_code=400, detail="Format d'export invalide")
+    encodeur, media_type = FORMATS_EXPORT[format]
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(
+                status_code=501, detail="Export Parquet indisponible (pyarrow absent)")
+        encodeur = partial(encodeur, types=repository.types_export(table))
+
+    colonnes = (repository.COLONNES_EXPORT_SIMULATIONS if table == "simulations"
+                else repository.COLONNES_EXPORT_DETAILS)
+    filtres = {
+        "date_debut": date_debut,
+        "date_fin": date_fin,
+        "client_id": client_id,
+        "operateur_id": operateur_id,
+        "inclure_supprimees": inclure_supprimees
+    }
+    await run_in_threadpool(file_ecriture.attendre, client_id=client_id)
+
+    def generer():
+        # Session propre au flux : elle doit vivre jusqu'au dernier octet envoyé
+        db = SessionLocal()
+        try:
+            lots = repository.iterer_export(db, table, filtres, taille_lot)
+            yield from instrumentation.suivre_flux(encodeur(colonnes, lots))
+        finally:
+            db.close()
+
+    return StreamingResponse(generer(), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{table}.{format}"'})
+
+
 @app.put("/simulations/{sim_id}/increment-export")
 async def increment_export(sim_id: int, type: str, db: Session = Depends(get_db)):
     # On cherche la simulation par son ID
+    await run_in_threadpool(file_ecriture.attendre, sim_id)
     db_sim = db.query(models.Simulation).filter(
         models.Simulation.id == sim_id).first()
 
@@ -356,3 +574,25 @@ async def stats_stockage():
     """
     stats = services.get_repository_info(services.EXPORT_PATH)
     return stats
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Histogrammes de latence (requêtes HTTP, étapes, SQL) au format Prometheus.
+    """
+    return PlainTextResponse(instrumentation.exposer_metriques(),
+                             media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/profils")
+async def lire_profils():
+    """
+    Derniers profils par échantillonnage (piles repliées).
+    Activation : PROFILAGE_ACTIF=1 + en-tête `X-Profilage: 1`, ou PROFILAGE_TAUX.
+
+    Les piles `boucle;...` couvrent toute la boucle d'événements, donc aussi les
+    requêtes concurrentes ; les piles `travail;...` sont celles des threads du
+    pool exécutant le rendu PDF ou le flux d'export de la requête profilée.
+    """
+    return list(instrumentation.PROFILS)
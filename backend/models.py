@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, BigInteger, Float, String, ForeignKey, DateTime, Boolean
 from sqlalchemy.orm import relationship
 import datetime
 from database import Base
@@ -54,7 +54,7 @@ class Simulation(Base):
 class SimulationDetail(Base):
     __tablename__ = "simulationDetail"
     id = Column(Integer, primary_key=True, index=True)
-    simulation_id = Column(Integer, ForeignKey("simulation.id"))
+    simulation_id = Column(Integer, ForeignKey("simulation.id"), index=True)
 
     mois = Column(Integer)
     mensualite = Column(Float)
@@ -63,4 +63,11 @@ class SimulationDetail(Base):
     capital_amorti = Column(Float)
     solde_restant = Column(Float)
 
+    # Montants exacts en centimes entiers (rapprochement au centime près)
+    mensualite_centimes = Column(BigInteger)
+    interet_centimes = Column(BigInteger)
+    assurance_centimes = Column(BigInteger)
+    capital_amorti_centimes = Column(BigInteger)
+    solde_restant_centimes = Column(BigInteger)
+
     simulation = relationship("Simulation", back_populates="details")
@@ -1,10 +1,14 @@
-from sqlalchemy import func
+import queue
+import threading
+from sqlalchemy import func, insert, select, text
 from sqlalchemy.orm import Session
 import models
 import schemas
+import instrumentation
 
 
-def save_simulation(db: Session, params: dict, echeancier: list, client_id: int = None):
+def save_simulation(db: Session, params: dict, echeancier: list, client_id: int = None,
+                    operateur_id: int = None):
     """
     Enregistre une simulation complète en base de données.
 
@@ -15,9 +19,11 @@ def save_simulation(db: Session, params: dict, echeancier: list, client_id: int
         # 1. Création de l'entête
         db_sim = models.Simulation(
             client_id=client_id if client_id else 1,  # Sécurité
+            operateur_id=operateur_id,
             montant_desire=params["montant"],
             taux_annuel=params["taux_annuel"],
             duree_mois=params["duree_mois"],
+            mensualite=params.get("mensualite"),
             is_deleted=False
         )
         db.add(db_sim)
@@ -25,16 +31,8 @@ def save_simulation(db: Session, params: dict, echeancier: list, client_id: int
         db.refresh(db_sim)
 
         # 2. Création des lignes du tableau
-        for ligne in echeancier:
-            db_detail = models.SimulationDetail(
-                simulation_id=db_sim.id,
-                mois=ligne["mois"],
-                mensualite=ligne["mensualite"],
-                interet=ligne["interet"],
-                capital_amorti=ligne["capital"],
-                solde_restant=ligne["solde"]
-            )
-            db.add(db_detail)
+        for ligne in _lignes_details(db_sim.id, echeancier):
+            db.add(models.SimulationDetail(**ligne))
 
         db.commit()
         return db_sim
@@ -44,6 +42,319 @@ def save_simulation(db: Session, params: dict, echeancier: list, client_id: int
         return None
 
 
+def _centimes(montant: float) -> int:
+    # Les montants de l'échéancier sont déjà au centime (centimes / 100 en mode
+    # centimes) : la conversion restitue exactement les entiers du moteur
+    return int(round(montant * 100))
+
+
+def _lignes_details(sim_id: int, echeancier: list) -> list:
+    """Prépare les lignes SimulationDetail pour une insertion groupée."""
+    return [{
+        "simulation_id": sim_id,
+        "mois": ligne["mois"],
+        "mensualite": ligne["mensualite"],
+        "interet": ligne["interet"],
+        "assurance": ligne["assurance"],
+        "capital_amorti": ligne["capital"],
+        "solde_restant": ligne["solde"],
+        "mensualite_centimes": _centimes(ligne["mensualite"]),
+        "interet_centimes": _centimes(ligne["interet"]),
+        "assurance_centimes": _centimes(ligne["assurance"]),
+        "capital_amorti_centimes": _centimes(ligne["capital"]),
+        "solde_restant_centimes": _centimes(ligne["solde"])
+    } for ligne in echeancier]
+
+
+class FileEcritureDifferee:
+    """
+    File d'écriture différée (write-behind) pour les simulations.
+
+    L'ID est réservé immédiatement pour être renvoyé au client, puis l'entête
+    et les lignes sont écrites en lots par un thread dédié. La file est bornée
+    (`taille_max` simulations) : si elle est pleine, `soumettre` attend que le
+    thread ait rattrapé son retard (ou rend la main si `bloquant=False`).
+    `arreter` vide la file avant de rendre la main.
+
+    Sur SQLite, l'ID vient d'un compteur en mémoire : il n'est fiable que si
+    ce processus est le seul à insérer des simulations. Il faut alors le
+    déclarer avec `compteur_local=True`, sinon `accepte` renvoie False et
+    l'appelant enregistre la simulation de façon synchrone.
+    """
+
+    def __init__(self, session_factory, taille_max: int = 500, taille_lot: int = 50,
+                 delai_flush: float = 0.2, compteur_local: bool = False):
+        self._session_factory = session_factory
+        self._file = queue.Queue(maxsize=taille_max)
+        self._taille_lot = taille_lot
+        self._delai_flush = delai_flush
+        self._compteur_local = compteur_local
+        self._verrou = threading.Lock()
+        self._prochain_id = None
+        self._thread = None
+        self._arret = threading.Event()
+        # Simulations soumises mais pas encore écrites : {sim_id: client_id}
+        self._en_attente = {}
+        self._ecrites = threading.Condition()
+
+    def demarrer(self):
+        """Lance le thread d'écriture (idempotent)."""
+        with self._verrou:
+            if self._thread is None or not self._thread.is_alive():
+                self._arret.clear()
+                self._thread = threading.Thread(
+                    target=self._boucle, name="ecriture-differee", daemon=True)
+                self._thread.start()
+
+    def arreter(self):
+        """Écrit tout ce qui reste en file puis arrête le thread."""
+        if self._thread is None:
+            return
+        self._arret.set()
+        self._thread.join()
+        self._thread = None
+
+    def vider(self):
+        """Bloque jusqu'à ce que toutes les simulations soumises soient en base."""
+        self.attendre()
+
+    def attendre(self, sim_id: int = None, client_id: int = None):
+        """
+        Bloque jusqu'à ce que la simulation `sim_id` (ou toutes celles du
+        client `client_id`, ou toutes à défaut) soit traitée par le thread.
+
+        Appel bloquant : depuis un handler async, passer par `run_in_threadpool`.
+        """
+        def en_attente():
+            if sim_id is not None:
+                return sim_id in self._en_attente
+            if client_id is not None:
+                return client_id in self._en_attente.values()
+            return bool(self._en_attente)
+
+        with self._ecrites:
+            self._ecrites.wait_for(lambda: not en_attente())
+
+    def accepte(self, db: Session) -> bool:
+        """Indique si les IDs réservés sont fiables pour cette base."""
+        return db.get_bind().dialect.name == "postgresql" or self._compteur_local
+
+    def reserver_id(self, db: Session) -> int:
+        """
+        Réserve l'ID de la prochaine simulation sans écrire l'entête.
+
+        PostgreSQL : séquence de la table. SQLite (poste local, un seul
+        processus déclaré par `compteur_local`) : compteur en mémoire
+        initialisé sur le MAX(id) existant.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            return db.execute(text(
+                "SELECT nextval(pg_get_serial_sequence('simulation', 'id'))")).scalar()
+        if not self._compteur_local:
+            raise RuntimeError(
+                "Compteur d'IDs en mémoire non fiable (plusieurs processus possibles).")
+
+        with self._verrou:
+            if self._prochain_id is None:
+                self._prochain_id = (db.query(
+                    func.max(models.Simulation.id)).scalar() or 0) + 1
+            sim_id = self._prochain_id
+            self._prochain_id += 1
+        return sim_id
+
+    def soumettre(self, sim_id: int, params: dict, echeancier: list,
+                  client_id: int = None, operateur_id: int = None,
+                  bloquant: bool = True) -> bool:
+        """
+        Met une simulation en file d'écriture. Si la file est pleine, attend
+        (`bloquant`) ou renvoie False sans rien mettre en file.
+        """
+        self.demarrer()
+        client_id = client_id if client_id else 1
+        with self._ecrites:
+            self._en_attente[sim_id] = client_id
+        try:
+            self._file.put((sim_id, params, echeancier, client_id, operateur_id),
+                           block=bloquant)
+        except queue.Full:
+            self._liberer([sim_id])
+            return False
+        return True
+
+    def _liberer(self, ids: list):
+        with self._ecrites:
+            for sim_id in ids:
+                self._en_attente.pop(sim_id, None)
+            self._ecrites.notify_all()
+
+    def _boucle(self):
+        while True:
+            try:
+                lot = [self._file.get(timeout=self._delai_flush)]
+            except queue.Empty:
+                if self._arret.is_set():
+                    return
+                continue
+
+            while len(lot) < self._taille_lot:
+                try:
+                    lot.append(self._file.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._ecrire_lot(lot)
+            finally:
+                self._liberer([element[0] for element in lot])
+                for _ in lot:
+                    self._file.task_done()
+
+    def _ecrire_lot(self, lot: list):
+        with instrumentation.etape("base_ecriture_lot"):
+            self._ecrire_lot_session(lot)
+
+    def _ecrire_lot_session(self, lot: list):
+        db = self._session_factory()
+        try:
+            try:
+                self._inserer(db, lot)
+                db.commit()
+                return
+            except Exception as e:
+                db.rollback()
+                print(f"ERREUR REPOSITORY (lot de {len(lot)}): {e}")
+
+            # Reprise unitaire pour ne perdre que les simulations fautives
+            for element in lot:
+                try:
+                    self._inserer(db, [element])
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    # L'ID a déjà été renvoyé au client : perte comptée sur /metrics
+                    instrumentation.ECRITURES_PERDUES.incrementer()
+                    print(f"ERREUR REPOSITORY (simulation {element[0]}): {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _inserer(db: Session, lot: list):
+        entetes = []
+        details = []
+        for sim_id, params, echeancier, client_id, operateur_id in lot:
+            entetes.append({
+                "id": sim_id,
+                "client_id": client_id,
+                "operateur_id": operateur_id,
+                "montant_desire": params["montant"],
+                "taux_annuel": params["taux_annuel"],
+                "duree_mois": params["duree_mois"],
+                "mensualite": params.get("mensualite"),
+                "nb_export_pdf": 0,
+                "nb_export_excel": 0,
+                "is_deleted": False
+            })
+            details.extend(_lignes_details(sim_id, echeancier))
+
+        db.execute(insert(models.Simulation), entetes)
+        if details:
+            db.execute(insert(models.SimulationDetail), details)
+
+
+# Colonnes exportées en masse (ordre des colonnes CSV)
+COLONNES_EXPORT_SIMULATIONS = (
+    "id", "client_id", "operateur_id", "date_traitement", "montant_desire",
+    "taux_annuel", "duree_mois", "mensualite", "nb_export_pdf", "nb_export_excel",
+    "is_deleted")
+COLONNES_EXPORT_DETAILS = (
+    "simulation_id", "mois", "mensualite", "interet", "assurance",
+    "capital_amorti", "solde_restant", "mensualite_centimes", "interet_centimes",
+    "assurance_centimes", "capital_amorti_centimes", "solde_restant_centimes")
+
+
+def types_export(table: str) -> tuple:
+    """Types Python des colonnes exportées (utilisés pour le schéma Parquet)."""
+    if table == "simulations":
+        return tuple(getattr(models.Simulation, c).type.python_type
+                     for c in COLONNES_EXPORT_SIMULATIONS)
+    return tuple(getattr(models.SimulationDetail, c).type.python_type
+                 for c in COLONNES_EXPORT_DETAILS)
+
+
+def _filtrer_simulations(requete, filtres: dict):
+    """Applique les filtres d'export (dates, client, opérateur, supprimées)."""
+    sim = models.Simulation
+    if filtres.get("date_debut"):
+        requete = requete.where(sim.date_traitement >= filtres["date_debut"])
+    if filtres.get("date_fin"):
+        requete = requete.where(sim.date_traitement <= filtres["date_fin"])
+    if filtres.get("client_id") is not None:
+        requete = requete.where(sim.client_id == filtres["client_id"])
+    if filtres.get("operateur_id") is not None:
+        requete = requete.where(sim.operateur_id == filtres["operateur_id"])
+    if not filtres.get("inclure_supprimees"):
+        requete = requete.where(sim.is_deleted == False)
+    return requete
+
+
+def iterer_export(db: Session, table: str, filtres: dict, taille_lot: int = 5000):
+    """
+    Parcourt les simulations ou leurs lignes de détail par lots, via un curseur
+    côté serveur (`stream_results`) : la mémoire reste constante quel que soit
+    le volume exporté.
+
+    Les simulations sont triées par ID, les détails par (simulation_id, mois).
+
+    Yields:
+        list: Lots de tuples dans l'ordre de COLONNES_EXPORT_*.
+    """
+    if table == "simulations":
+        colonnes = [getattr(models.Simulation, c)
+                    for c in COLONNES_EXPORT_SIMULATIONS]
+        requete = _filtrer_simulations(select(*colonnes), filtres).order_by(
+            models.Simulation.id)
+    else:
+        colonnes = [getattr(models.SimulationDetail, c)
+                    for c in COLONNES_EXPORT_DETAILS]
+        requete = _filtrer_simulations(
+            select(*colonnes).join(models.Simulation), filtres).order_by(
+            models.SimulationDetail.simulation_id, models.SimulationDetail.mois)
+
+    resultat = db.execute(requete.execution_options(
+        stream_results=True, yield_per=taille_lot))
+    for lot in resultat.partitions():
+        yield lot
+
+
+def lire_echeancier(db: Session, sim_id: int) -> list:
+    """
+    Relit l'échéancier enregistré d'une simulation, au format de
+    `services.generer_echeancier`, trié par mois.
+
+    Les lignes anciennes n'ont pas d'assurance enregistrée : la prime fixe est
+    alors déduite de la dernière échéance (capital + intérêt + assurance).
+    """
+    d = models.SimulationDetail
+    lignes = db.execute(
+        select(d.mois, d.mensualite, d.capital_amorti, d.interet, d.assurance,
+               d.solde_restant)
+        .where(d.simulation_id == sim_id).order_by(d.mois)).all()
+    if not lignes:
+        return []
+
+    derniere = lignes[-1]
+    assurance_deduite = round(
+        derniere.mensualite - derniere.capital_amorti - derniere.interet, 2)
+    return [{
+        "mois": ligne.mois,
+        "mensualite": ligne.mensualite,
+        "capital": ligne.capital_amorti,
+        "interet": ligne.interet,
+        "assurance": ligne.assurance if ligne.assurance is not None else assurance_deduite,
+        "solde": ligne.solde_restant
+    } for ligne in lignes]
+
+
 def get_historique(db: Session):
     """Récupère toutes les simulations non supprimées (Point 3)."""
     return db.query(models.Simulation).filter(models.Simulation.is_deleted == False).all()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Literal
 
 
 class ClientInfo(BaseModel):
@@ -43,6 +43,8 @@ class LoanInput(BaseModel):
     type_taux: str = Field(
         "fixe", description="Type de taux (fixe ou variable)")
     changements_taux: Optional[Dict[int, float]] = None
+    mode_calcul: Literal["flottant", "centimes"] = Field(
+        "flottant", description="Moteur flottant historique ou centimes entiers exacts")
 
     # Liaison avec le client
     client: Optional[ClientInfo] = None
@@ -51,8 +53,69 @@ class LoanInput(BaseModel):
     client_id: Optional[int] = None
     operateur_id: Optional[int] = None
 
+    # Les simulations exploratoires ("what-if") peuvent ne pas être enregistrées
+    persist: bool = Field(
+        True, description="Enregistrer la simulation en base")
+
+
+class ExportPdfInput(BaseModel):
+    """Échéancier à exporter, avec les paramètres finaux pour la page de synthèse"""
+    echeancier: List[Dict]
+    params_finaux: Optional[Dict] = None
+
 
 class SimulationResponse(BaseModel):
     """Schéma pour la réponse envoyée au frontend React"""
     params_finaux: Dict
     echeancier: List[Dict]
+
+
+class EvenementScenario(BaseModel):
+    """
+    Événement appliqué à une simulation existante (remboursement anticipé,
+    renégociation, changement de mensualité ou de durée).
+    """
+    type: Literal["remboursement_anticipe", "renegociation_taux",
+                  "modification_mensualite", "modification_duree"] = Field(
+        ..., example="remboursement_anticipe", description="Type d'événement")
+    mois: int = Field(..., gt=0, le=600,
+                      description="Mois à partir duquel l'événement s'applique")
+    montant: Optional[float] = Field(
+        None, gt=0, description="Montant du remboursement anticipé")
+    mode: Literal["duree", "mensualite"] = Field(
+        "duree", description="Après remboursement : réduire la 'duree' ou la 'mensualite'")
+    taux_annuel: Optional[float] = Field(
+        None, description="Nouveau taux annuel en %")
+    mensualite: Optional[float] = Field(
+        None, gt=0, description="Nouvelle mensualité hors assurance")
+    duree_mois: Optional[int] = Field(
+        None, gt=0, le=600, description="Nouvelle durée totale en mois")
+
+
+class ScenarioInput(BaseModel):
+    """Liste d'événements à rejouer sur une simulation enregistrée"""
+    evenements: List[EvenementScenario]
+
+
+class OffrePret(BaseModel):
+    """Offre bancaire à comparer (taux, assurance, durée et frais)"""
+    nom: Optional[str] = Field(None, example="Banque A")
+    montant: Optional[float] = Field(
+        None, gt=0, description="Montant propre à l'offre (sinon montant commun)")
+    taux_annuel: float = Field(..., ge=0, description="Taux d'intérêt annuel en %")
+    taux_assurance: float = Field(
+        0.36, ge=0, description="Taux annuel de l'assurance en %")
+    duree_mois: int = Field(..., gt=0, le=600, description="Durée en mois")
+    frais: float = Field(
+        0.0, ge=0, description="Frais de dossier et de garantie")
+
+
+class ComparaisonInput(BaseModel):
+    """Comparaison sans état de plusieurs offres pour un même projet"""
+    montant: Optional[float] = Field(None, gt=0, description="Montant du prêt")
+    offres: List[OffrePret]
+    critere: Literal["cout_total_credit", "taeg", "mensualite_totale"] = Field(
+        "cout_total_credit", description="Critère de classement croissant")
+    persist: bool = Field(
+        False, description="Enregistrer chaque offre comme simulation")
+    client_id: Optional[int] = None
@@ -1,14 +1,14 @@
+import csv
+import io
+import json
 import math
-import numpy_financial as npf
 import os
-import pandas as pd
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
 
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-
+# numpy, pandas et ReportLab sont importés à la première utilisation :
+# /calculer n'en a pas besoin et le démarrage des workers reste rapide.
 
 # Chemin vers le dossier de stockage
 EXPORT_PATH = "exported_simulations"
@@ -110,20 +110,36 @@ def generer_echeancier(m: float, n: int, p: float, t_mensuel: float, taux_assura
     Returns:
         tuple: (liste_echeances, total_interets, total_assurance)
     """
-    echeancier = []
-    solde = m
-    total_interets_cumules = 0
-    total_assurance_cumulee = 0
-
     # On calcule la prime fixe une seule fois à l'extérieur pour la performance
     assurance_fixe = round((m * (taux_assurance_annuel / 100)) / 12, 2)
 
-    for mois in range(1, n + 1):
+    echeancier, _, total_interets_cumules = _generer_periode(
+        m, 1, n, n, p, t_mensuel, assurance_fixe)
+    total_assurance_cumulee = assurance_fixe * len(echeancier)
+
+    return echeancier, round(total_interets_cumules, 2), round(total_assurance_cumulee, 2)
+
+
+def _generer_periode(solde: float, mois_debut: int, mois_fin: int, n_final: int,
+                     p: float, t_mensuel: float, assurance_fixe: float):
+    """
+    Calcule les échéances de `mois_debut` à `mois_fin` inclus à partir d'un solde donné.
+
+    Cœur de `generer_echeancier`, isolé pour permettre aux scénarios de ne
+    recalculer que la portion de l'échéancier située après un événement.
+
+    Returns:
+        tuple: (liste_echeances, solde_final, total_interets_non_arrondi)
+    """
+    echeancier = []
+    total_interets_cumules = 0
+
+    for mois in range(mois_debut, mois_fin + 1):
         # 1. Arrondir l'intérêt immédiatement
         interet = round(solde * t_mensuel, 2)
 
         # 2. Gestion de la dernière échéance pour tomber pile à zéro
-        if mois == n:
+        if mois == n_final:
             capital = round(solde, 2)
             mensualite_totale = capital + interet + assurance_fixe
         else:
@@ -134,7 +150,6 @@ def generer_echeancier(m: float, n: int, p: float, t_mensuel: float, taux_assura
 
         # Cumul pour les stats
         total_interets_cumules += interet
-        total_assurance_cumulee += assurance_fixe
 
         echeancier.append({
             "mois": mois,
@@ -145,11 +160,385 @@ def generer_echeancier(m: float, n: int, p: float, t_mensuel: float, taux_assura
             "solde": max(0, solde)  # Sécurité contre le -0.0
         })
 
-    return echeancier, round(total_interets_cumules, 2), round(total_assurance_cumulee, 2)
+    return echeancier, solde, total_interets_cumules
+
+
+# Précision du taux mensuel en virgule fixe pour le mode centimes
+ECHELLE_TAUX = 10**15
+
+
+def en_centimes(montant) -> int:
+    """Convertit un montant en centimes entiers (arrondi commercial)."""
+    return int(Decimal(str(montant)).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def generer_echeancier_centimes(m: float, n: int, p: float, t_mensuel: float,
+                                taux_assurance_annuel: float = 0.36):
+    """
+    Variante exacte de `generer_echeancier` en centimes entiers.
+
+    Le taux mensuel est figé en virgule fixe (ECHELLE_TAUX) et chaque intérêt
+    est arrondi au centime supérieur à partir de 0,5 (arrondi commercial) en
+    arithmétique entière : aucun écart ne s'accumule, les totaux sont des sommes
+    exactes et le capital amorti totalise exactement le montant emprunté
+    (solde final à zéro). Le résultat est identique sur toutes les plateformes.
+
+    Returns:
+        tuple: (liste_echeances, total_interets, total_assurance), montants en euros
+               reconstruits à partir des centimes.
+    """
+    m_c = en_centimes(m)
+    p_c = en_centimes(p)
+    taux_fp = int(Decimal(repr(t_mensuel)).scaleb(15).quantize(
+        Decimal(1), rounding=ROUND_HALF_UP))
+    demi = ECHELLE_TAUX // 2
+    assurance_c = int((Decimal(m_c) * Decimal(str(taux_assurance_annuel)) / 1200).quantize(
+        Decimal(1), rounding=ROUND_HALF_UP))
+
+    echeancier = []
+    solde_c = m_c
+    total_interets_c = 0
+
+    for mois in range(1, n + 1):
+        interet_c = (solde_c * taux_fp + demi) // ECHELLE_TAUX
+        # La dernière échéance solde exactement le capital restant ; une
+        # mensualité arrondie par excès peut solder le prêt un peu plus tôt
+        capital_c = p_c - interet_c
+        if mois == n or capital_c > solde_c:
+            capital_c = solde_c
+        solde_c -= capital_c
+        total_interets_c += interet_c
+
+        echeancier.append({
+            "mois": mois,
+            "mensualite": (capital_c + interet_c + assurance_c) / 100,
+            "capital": capital_c / 100,
+            "interet": interet_c / 100,
+            "assurance": assurance_c / 100,
+            "solde": solde_c / 100
+        })
+
+    return echeancier, total_interets_c / 100, assurance_c * n / 100
+
+
+def resoudre_parametres_centimes(m: float, t_annuel: float, n: int, p: float):
+    """
+    Variante de `resoudre_parametres_pret` pour le mode centimes.
+
+    Quand la mensualité est saisie et que le montant ou la durée est résolu,
+    le montant résolu est arrondi au centime inférieur. Les arrondis au centime
+    des intérêts peuvent encore porter la dernière échéance (hors assurance) un
+    centime au-dessus de la mensualité : le montant résolu est alors réduit au
+    centime près, ou la durée résolue allongée d'un mois, jusqu'à ce que la
+    dernière échéance ne dépasse plus la mensualité.
+
+    Returns:
+        tuple: (montant, duree_mois, mensualite, taux_mensuel_actuariel)
+    """
+    montant_resolu = not (m and m > 0) and n and n > 0 and p and p > 0
+    duree_resolue = not (n and n > 0) and m and m > 0 and p and p > 0
+    m, n, p, t_mensuel = resoudre_parametres_pret(m, t_annuel, n, p)
+    if not (montant_resolu or duree_resolue):
+        return m, n, p, t_mensuel
+    if montant_resolu:
+        # Capital empruntable arrondi au centime inférieur
+        m = math.floor(round(m * 100, 6)) / 100
+
+    p_c = en_centimes(p)
+    while True:
+        derniere = generer_echeancier_centimes(m, n, p, t_mensuel)[0][-1]
+        if en_centimes(derniere["capital"]) + en_centimes(derniere["interet"]) <= p_c:
+            return m, n, p, t_mensuel
+        if montant_resolu:
+            m = (en_centimes(m) - 1) / 100
+        else:
+            n += 1
+
 
+def simuler_scenario(reference: list, m: float, t_annuel: float, p: float,
+                     evenements: list) -> dict:
+    """
+    Rejoue un prêt existant en appliquant une liste d'événements (what-if).
+
+    Le préfixe de l'échéancier antérieur au premier événement est repris tel
+    quel depuis l'échéancier enregistré (`reference`) ; seuls les mois suivants
+    sont recalculés.
+
+    Événements supportés (clé `type`, appliqués au début du mois `mois`) :
+        - remboursement_anticipe: `montant` versé, puis `mode` "duree" (mensualité
+          conservée, durée réduite) ou "mensualite" (durée conservée). Le montant
+          versé figure dans le capital (et la mensualité) de la ligne du mois ;
+          s'il solde le prêt, cette ligne est la dernière, sans intérêt.
+        - renegociation_taux: nouveau `taux_annuel`, durée conservée.
+        - modification_mensualite: nouvelle `mensualite`, durée recalculée.
+        - modification_duree: nouvelle `duree_mois` totale, mensualité recalculée.
+
+    Args:
+        reference: Échéancier enregistré (lignes au format de `generer_echeancier`).
+        m: Capital initial.
+        t_annuel: Taux annuel de la simulation.
+        p: Mensualité hors assurance de la simulation.
+        evenements: Liste de dicts décrivant les événements.
+
+    Returns:
+        dict: Échéancier du scénario, totaux et écarts par rapport à la référence.
 
-if not os.path.exists(EXPORT_PATH):
-    os.makedirs(EXPORT_PATH)
+    Raises:
+        ValueError: Si un événement est invalide ou hors de la durée du prêt.
+    """
+    if not reference:
+        raise ValueError("Échéancier de référence introuvable.")
+    t_mensuel = convertir_taux_actuariel(t_annuel or 0)
+    n = len(reference)
+    ref_interets = round(sum(ligne["interet"] for ligne in reference), 2)
+    ref_assurance = round(sum(ligne["assurance"] for ligne in reference), 2)
+    assurance_fixe = reference[-1]["assurance"]
+
+    if not evenements:
+        raise ValueError("Aucun événement fourni pour le scénario.")
+    evenements = sorted(evenements, key=lambda e: e["mois"])
+    for ev in evenements:
+        if not 1 <= ev["mois"] <= n:
+            raise ValueError(
+                f"L'événement du mois {ev['mois']} est hors de la durée du prêt.")
+
+    # Reprise du préfixe inchangé
+    premier_mois = evenements[0]["mois"]
+    echeancier = list(reference[:premier_mois - 1])
+    solde = echeancier[-1]["solde"] if echeancier else m
+    total_interets = sum(ligne["interet"] for ligne in echeancier)
+
+    taux_courant = t_annuel or 0
+    n_final = n
+    # Remboursements anticipés à reporter sur la prochaine ligne calculée
+    verse = 0
+
+    for i, ev in enumerate(evenements):
+        mois = ev["mois"]
+        if mois > n_final or solde <= 0:
+            break
+        n_restant = n_final - mois + 1
+
+        if ev["type"] == "remboursement_anticipe":
+            montant = min(ev.get("montant") or 0, solde)
+            if montant <= 0:
+                raise ValueError(
+                    "Le remboursement anticipé doit avoir un montant positif.")
+            solde = round(solde - montant, 2)
+            verse = round(verse + montant, 2)
+            if solde <= 0:
+                # Versé en début de mois : aucun intérêt ne court sur ce mois
+                echeancier.append({
+                    "mois": mois,
+                    "mensualite": round(verse + assurance_fixe, 2),
+                    "capital": verse,
+                    "interet": 0.0,
+                    "assurance": assurance_fixe,
+                    "solde": 0
+                })
+                break
+            if ev.get("mode", "duree") == "mensualite":
+                _, _, p, _ = resoudre_parametres_pret(
+                    solde, taux_courant, n_restant, None)
+            else:
+                _, n_restant, _, _ = resoudre_parametres_pret(
+                    solde, taux_courant, None, p)
+        elif ev["type"] == "renegociation_taux":
+            if ev.get("taux_annuel") is None:
+                raise ValueError("La renégociation requiert un taux_annuel.")
+            taux_courant = ev["taux_annuel"]
+            _, _, p, t_mensuel = resoudre_parametres_pret(
+                solde, taux_courant, n_restant, None)
+        elif ev["type"] == "modification_mensualite":
+            if not ev.get("mensualite"):
+                raise ValueError("La modification requiert une mensualite.")
+            p = ev["mensualite"]
+            _, n_restant, _, _ = resoudre_parametres_pret(
+                solde, taux_courant, None, p)
+        elif ev["type"] == "modification_duree":
+            if not ev.get("duree_mois") or ev["duree_mois"] < mois:
+                raise ValueError(
+                    "La nouvelle durée doit couvrir le mois de l'événement.")
+            n_restant = ev["duree_mois"] - mois + 1
+            _, _, p, _ = resoudre_parametres_pret(
+                solde, taux_courant, n_restant, None)
+        else:
+            raise ValueError(f"Type d'événement inconnu : {ev['type']}")
+
+        n_final = mois + n_restant - 1
+        mois_fin = n_final
+        if i + 1 < len(evenements):
+            mois_fin = min(n_final, evenements[i + 1]["mois"] - 1)
+
+        lignes, solde, interets = _generer_periode(
+            solde, mois, mois_fin, n_final, p, t_mensuel, assurance_fixe)
+        if lignes and verse:
+            lignes[0]["capital"] = round(lignes[0]["capital"] + verse, 2)
+            lignes[0]["mensualite"] = round(lignes[0]["mensualite"] + verse, 2)
+            verse = 0
+        echeancier.extend(lignes)
+        total_interets += interets
+
+    total_interets = round(total_interets, 2)
+    total_assurance = round(sum(ligne["assurance"] for ligne in echeancier), 2)
+    duree = len(echeancier)
+
+    return {
+        "echeancier": echeancier,
+        "duree_mois": duree,
+        "total_interets": total_interets,
+        "total_assurance": total_assurance,
+        "cout_total_credit": round(total_interets + total_assurance, 2),
+        "delta_interets": round(total_interets - ref_interets, 2),
+        "delta_assurance": round(total_assurance - ref_assurance, 2),
+        "delta_duree_mois": duree - n
+    }
+
+
+# Borne haute de la dichotomie du TAEG (100 % par mois)
+TAUX_MENSUEL_MAX = 1.0
+
+
+def _interets_echeancier(m, n, p, t_mensuel):
+    """
+    Total des intérêts de `generer_echeancier` pour chaque offre, calculé
+    mois par mois en colonnes avec les mêmes arrondis au centime.
+
+    Les offres sont triées par durée : au mois k, seules celles qui durent
+    au moins k mois (un suffixe du tri) sont calculées.
+    """
+    import numpy as np
+
+    ordre = np.argsort(n, kind="stable")
+    duree = n[ordre]
+    solde = m[ordre].copy()
+    mensualite = p[ordre]
+    taux = t_mensuel[ordre]
+    total = np.zeros_like(solde)
+
+    for mois in range(1, int(duree[-1]) + 1):
+        debut = np.searchsorted(duree, mois)
+        fin = np.searchsorted(duree, mois, side="right")
+        courant = solde[debut:]
+        interet = np.round(courant * taux[debut:], 2)
+        capital = np.round(mensualite[debut:] - interet, 2)
+        # Dernière échéance des offres qui se terminent ce mois-ci
+        capital[:fin - debut] = np.round(courant[:fin - debut], 2)
+        total[debut:] += interet
+        solde[debut:] = np.round(courant - capital, 2)
+
+    resultat = np.empty_like(total)
+    resultat[ordre] = total
+    return resultat
+
+
+def _taux_effectif_mensuel(net_recu, echeance, n, iterations: int = 60):
+    """
+    Résout par dichotomie vectorisée le taux mensuel r tel que
+    net_recu = echeance * (1 - (1 + r)^-n) / r pour chaque offre.
+    """
+    import numpy as np
+
+    bas = np.full(net_recu.shape, 1e-12)
+    haut = np.full(net_recu.shape, TAUX_MENSUEL_MAX)
+    for _ in range(iterations):
+        milieu = (bas + haut) / 2
+        valeur = echeance * (1 - (1 + milieu) ** -n) / milieu
+        # La valeur actuelle décroît avec le taux : trop haute => taux trop bas
+        trop_bas = valeur > net_recu
+        bas = np.where(trop_bas, milieu, bas)
+        haut = np.where(trop_bas, haut, milieu)
+    return (bas + haut) / 2
+
+
+def comparer_offres(offres: list, critere: str = "cout_total_credit") -> list:
+    """
+    Compare N offres de prêt en une seule passe vectorisée.
+
+    Applique en colonnes les formules de `resoudre_parametres_pret`, puis
+    cumule les intérêts mois par mois avec les arrondis de `generer_echeancier`
+    (sans construire d'échéancier) : les totaux et le classement sont ceux que
+    donnerait /calculer pour chaque offre, à un centime près dans les rares cas
+    où np.round et round() tranchent différemment un demi-centime.
+
+    Args:
+        offres: Liste de dicts (montant, taux_annuel, duree_mois, taux_assurance, frais).
+        critere: Clé de classement croissant (cout_total_credit, taeg ou mensualite_totale).
+
+    Returns:
+        list: Offres enrichies et classées, avec leur `rang` (1 = meilleure).
+
+    Raises:
+        ValueError: Si le critère est inconnu, si des frais atteignent le montant
+            ou si un TAEG dépasse la borne de calcul.
+    """
+    if critere not in ("cout_total_credit", "taeg", "mensualite_totale"):
+        raise ValueError(f"Critère de classement inconnu : {critere}")
+    if not offres:
+        return []
+
+    import numpy as np
+
+    m = np.array([o["montant"] for o in offres], dtype=float)
+    n = np.array([o["duree_mois"] for o in offres], dtype=float)
+    taux = np.array([o.get("taux_annuel") or 0 for o in offres], dtype=float)
+    taux_assu = np.array([o.get("taux_assurance") or 0 for o in offres], dtype=float)
+    frais = np.array([o.get("frais") or 0 for o in offres], dtype=float)
+
+    # Des frais >= montant laissent un net perçu nul ou négatif : TAEG sans sens
+    invalides = np.flatnonzero(frais >= m)
+    if invalides.size:
+        nom = offres[invalides[0]].get("nom")
+        raise ValueError(f"Frais supérieurs ou égaux au montant pour l'offre {nom}.")
+
+    # Même conversion actuarielle que convertir_taux_actuariel
+    t_mensuel = (1 + taux / 100) ** (1 / 12) - 1
+    taux_nul = t_mensuel == 0
+    t_calc = np.where(taux_nul, 1.0, t_mensuel)
+    p = np.where(taux_nul, m / n, (m * t_calc) / (1 - (1 + t_calc) ** -n))
+
+    # round() Python, comme generer_echeancier (np.round diffère sur les demi-centimes)
+    assurance_fixe = np.array(
+        [round(prime, 2) for prime in ((m * (taux_assu / 100)) / 12).tolist()])
+    mensualite_totale = p + assurance_fixe
+    total_interets = _interets_echeancier(m, n, p, t_mensuel)
+    total_assurance = assurance_fixe * n
+    cout_total = total_interets + total_assurance + frais
+
+    # TAEG : taux actuariel annuel égalisant le net perçu et les échéances
+    net_recu = m - frais
+    r = _taux_effectif_mensuel(net_recu, mensualite_totale, n)
+    r = np.where(mensualite_totale * n <= net_recu, 0.0, r)
+    hors_borne = np.flatnonzero(r >= TAUX_MENSUEL_MAX * (1 - 1e-9))
+    if hors_borne.size:
+        nom = offres[hors_borne[0]].get("nom")
+        raise ValueError(f"TAEG hors des limites de calcul pour l'offre {nom}.")
+    taeg = ((1 + r) ** 12 - 1) * 100
+
+    colonnes = {
+        "mensualite": np.round(p, 2),
+        "mensualite_totale": np.round(mensualite_totale, 2),
+        "total_interets": np.round(total_interets, 2),
+        "total_assurance": np.round(total_assurance, 2),
+        "cout_total_credit": np.round(cout_total, 2),
+        "taeg": np.round(taeg, 3)
+    }
+
+    # Classement sur la colonne arrondie (tri stable : ordre d'entrée à égalité)
+    ordre = np.argsort(colonnes[critere], kind="stable")
+    valeurs = {cle: col[ordre].tolist() for cle, col in colonnes.items()}
+    cles = tuple(valeurs)
+    return [
+        {**offres[i], **dict(zip(cles, ligne)), "rang": rang}
+        for rang, (i, *ligne) in enumerate(
+            zip(ordre.tolist(), *valeurs.values()), start=1)
+    ]
+
+
+def _dossier_export() -> str:
+    """Crée le dossier d'export au premier besoin et retourne son chemin."""
+    os.makedirs(EXPORT_PATH, exist_ok=True)
+    return EXPORT_PATH
 
 
 def sauvegarder_excel_localement(echeancier: list, simulation_id: int) -> str:
@@ -163,12 +552,14 @@ def sauvegarder_excel_localement(echeancier: list, simulation_id: int) -> str:
     Returns:
         str: Le chemin complet du fichier sauvegardé.
     """
+    import pandas as pd
+
     df = pd.DataFrame(echeancier)
 
     # Création d'un nom de fichier unique
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     nom_fichier = f"simulation_{simulation_id}_{timestamp}.xlsx"
-    chemin_complet = os.path.join(EXPORT_PATH, nom_fichier)
+    chemin_complet = os.path.join(_dossier_export(), nom_fichier)
 
     # Sauvegarde physique (Point 4)
     df.to_excel(chemin_complet, index=False, engine='openpyxl')
@@ -176,51 +567,234 @@ def sauvegarder_excel_localement(echeancier: list, simulation_id: int) -> str:
     return chemin_complet
 
 
-def sauvegarder_pdf_localement(echeancier: list, simulation_id: int) -> str:
+# Mise en page du PDF : hauteurs fixes pour découper l'échéancier en pages
+# sans laisser ReportLab mesurer puis scinder un tableau géant.
+PDF_HAUTEUR_ENTETE = 20
+PDF_HAUTEUR_LIGNE = 14
+# Poids relatifs des colonnes, répartis sur la largeur utile de la page
+PDF_PROPORTIONS_COLONNES = (50, 85, 85, 80, 80, 100)
+PDF_ENTETE = ("Mois", "Mensualité", "Capital", "Intérêt", "Assurance", "Solde")
+
+
+@lru_cache(maxsize=1)
+def _gabarit_pdf() -> dict:
+    """
+    Styles, style de tableau et format de page construits une seule fois
+    par processus puis réutilisés par chaque export PDF.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    marge = 72
+    largeur_utile = A4[0] - 2 * marge
+    hauteur_utile = A4[1] - 2 * marge
+    lignes_par_page = int((hauteur_utile - PDF_HAUTEUR_ENTETE) // PDF_HAUTEUR_LIGNE)
+    total_proportions = sum(PDF_PROPORTIONS_COLONNES)
+
+    return {
+        "pagesize": A4,
+        "marge": marge,
+        "largeur_utile": largeur_utile,
+        "largeurs_colonnes": tuple(
+            largeur_utile * poids / total_proportions
+            for poids in PDF_PROPORTIONS_COLONNES),
+        "styles": getSampleStyleSheet(),
+        "lignes_par_page": lignes_par_page,
+        "style_tableau": TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.blue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('TOPPADDING', (0, 0), (-1, -1), 1),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]),
+        "style_synthese": TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('LINEBELOW', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6)
+        ])
+    }
+
+
+def _synthese_pdf(echeancier: list, params_finaux: dict = None) -> list:
+    """Lignes de la page de synthèse (params_finaux, sinon déduites de l'échéancier)."""
+    if not params_finaux:
+        total_interets = sum(row["interet"] for row in echeancier)
+        total_assurance = sum(row["assurance"] for row in echeancier)
+        params_finaux = {
+            "montant": sum(row["capital"] for row in echeancier),
+            "duree_mois": len(echeancier),
+            "mensualite": echeancier[0]["mensualite"] if echeancier else 0,
+            "total_interets": total_interets,
+            "total_assurance": total_assurance,
+            "cout_total_credit": total_interets + total_assurance
+        }
+
+    libelles = [
+        ("montant", "Montant emprunté", "{:,.2f} €"),
+        ("taux_annuel", "Taux annuel", "{:.2f} %"),
+        ("duree_mois", "Durée", "{} mois"),
+        ("mensualite", "Mensualité", "{:,.2f} €"),
+        ("total_interets", "Total des intérêts", "{:,.2f} €"),
+        ("total_assurance", "Total de l'assurance", "{:,.2f} €"),
+        ("cout_total_credit", "Coût total du crédit", "{:,.2f} €"),
+    ]
+    return [[libelle, fmt.format(params_finaux[cle]).replace(",", " ")]
+            for cle, libelle, fmt in libelles if params_finaux.get(cle) is not None]
+
+
+def sauvegarder_pdf_localement(echeancier: list, simulation_id: int,
+                               params_finaux: dict = None) -> str:
     """
     Génère un rapport PDF de l'échéancier et le sauvegarde localement.
+
+    Une page de synthèse (params_finaux) précède l'échéancier, découpé à
+    l'avance en tableaux d'une page avec en-tête répété. Chaque page est
+    dessinée puis libérée : un seul tableau est en mémoire à la fois.
     """
+    from reportlab.pdfgen.canvas import Canvas
+    from reportlab.platypus import Table, Paragraph
+
+    gabarit = _gabarit_pdf()
+    styles = gabarit["styles"]
+    hauteur = gabarit["pagesize"][1]
+    marge = gabarit["marge"]
+    largeur_utile = gabarit["largeur_utile"]
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     nom_fichier = f"simulation_{simulation_id}_{timestamp}.pdf"
-    chemin_complet = os.path.join(EXPORT_PATH, nom_fichier)
-
-    doc = SimpleDocTemplate(chemin_complet, pagesize=A4)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Titre
-    elements.append(Paragraph(
-        f"Tableau d'amortissement - Simulation #{simulation_id}", styles['Title']))
-    elements.append(Paragraph(
-        f"Généré le : {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
-
-    # Préparation des données du tableau
-    data = [["Mois", "Mensualité", "Capital", "Intérêt", "Assurance", "Solde"]]
-    for row in echeancier:
-        data.append([
-            row["mois"],
-            f"{row['mensualite']:.2f}",
-            f"{row['capital']:.2f}",
-            f"{row['interet']:.2f}",
-            f"{row['assurance']:.2f}",
-            f"{row['solde']:.2f}"
-        ])
+    chemin_complet = os.path.join(_dossier_export(), nom_fichier)
+
+    canvas = Canvas(chemin_complet, pagesize=gabarit["pagesize"])
+
+    def dessiner(flowable, y: float) -> float:
+        _, h = flowable.wrapOn(canvas, largeur_utile, y - marge)
+        flowable.drawOn(canvas, marge, y - h)
+        return y - h
+
+    # Page de synthèse
+    y = hauteur - marge
+    y = dessiner(Paragraph(
+        f"Tableau d'amortissement - Simulation #{simulation_id}", styles['Title']), y)
+    y = dessiner(Paragraph(
+        f"Généré le : {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal']), y)
+    synthese = _synthese_pdf(echeancier, params_finaux)
+    if synthese:
+        tableau = Table(synthese, colWidths=(200, 150))
+        tableau.setStyle(gabarit["style_synthese"])
+        dessiner(tableau, y - 12)
+    canvas.showPage()
+
+    # Échéancier : un tableau par page
+    n_page = gabarit["lignes_par_page"]
+    for debut in range(0, len(echeancier), n_page):
+        data = [PDF_ENTETE]
+        for row in echeancier[debut:debut + n_page]:
+            data.append((
+                row["mois"],
+                f"{row['mensualite']:.2f}",
+                f"{row['capital']:.2f}",
+                f"{row['interet']:.2f}",
+                f"{row['assurance']:.2f}",
+                f"{row['solde']:.2f}"
+            ))
+        tableau = Table(
+            data, colWidths=gabarit["largeurs_colonnes"],
+            rowHeights=[PDF_HAUTEUR_ENTETE] + [PDF_HAUTEUR_LIGNE] * (len(data) - 1))
+        tableau.setStyle(gabarit["style_tableau"])
+        dessiner(tableau, hauteur - marge)
+        canvas.showPage()
+
+    canvas.save()
+
+    return chemin_complet
 
-    # Création du tableau PDF
-    t = Table(data)
-    t.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.blue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
 
-    elements.append(t)
-    doc.build(elements)
+def _valeur_export(valeur):
+    return valeur.isoformat() if isinstance(valeur, datetime) else valeur
 
-    return chemin_complet
+
+def flux_csv(colonnes: tuple, lots):
+    """Encode des lots de tuples en CSV, un morceau de texte par lot."""
+    tampon = io.StringIO()
+    writer = csv.writer(tampon)
+    writer.writerow(colonnes)
+    for lot in lots:
+        writer.writerows([[_valeur_export(v) for v in ligne] for ligne in lot])
+        yield tampon.getvalue()
+        tampon.seek(0)
+        tampon.truncate(0)
+    if tampon.tell():
+        yield tampon.getvalue()
+
+
+def flux_ndjson(colonnes: tuple, lots):
+    """Encode des lots de tuples en NDJSON (un objet JSON par ligne)."""
+    for lot in lots:
+        yield "".join(
+            json.dumps(dict(zip(colonnes, map(_valeur_export, ligne))),
+                       ensure_ascii=False) + "\n"
+            for ligne in lot)
+
+
+class _TamponFlux(io.RawIOBase):
+    """Sortie fichier minimale qui rend les octets écrits au fil de l'eau."""
+
+    def __init__(self):
+        self._morceaux = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, donnees):
+        self._morceaux.append(bytes(donnees))
+        self._position += len(donnees)
+        return len(donnees)
+
+    def tell(self):
+        return self._position
+
+    def vider(self) -> bytes:
+        donnees = b"".join(self._morceaux)
+        self._morceaux = []
+        return donnees
+
+
+def flux_parquet(colonnes: tuple, lots, types: tuple):
+    """
+    Encode des lots de tuples en Parquet, un row group par lot.
+
+    Nécessite pyarrow (dépendance optionnelle).
+
+    Args:
+        types: Types Python des colonnes (int, float, bool, str, datetime),
+               pour un schéma stable même si une colonne est entièrement vide.
+
+    Raises:
+        ImportError: Si pyarrow n'est pas installé.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types_arrow = {int: pa.int64(), float: pa.float64(), bool: pa.bool_(),
+                   str: pa.string(), datetime: pa.timestamp("us")}
+    schema = pa.schema([(nom, types_arrow.get(t, pa.string()))
+                        for nom, t in zip(colonnes, types)])
+
+    sortie = _TamponFlux()
+    with pq.ParquetWriter(sortie, schema) as writer:
+        for lot in lots:
+            writer.write_table(pa.Table.from_pylist(
+                [dict(zip(colonnes, ligne)) for ligne in lot], schema=schema))
+            yield sortie.vider()
+    yield sortie.vider()
 
 
 # def get_repository_info(directory: str) -> dict:
@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Les modules du backend sont importés à plat (comme avec `uvicorn main:app`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Base SQLite jetable : database.py lit DATABASE_URL à l'import
+_DOSSIER = tempfile.mkdtemp(prefix="tests_backend_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DOSSIER, 'tests.db')}"
+os.environ.setdefault("CREER_SCHEMA", "1")
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    import services
+
+    services.EXPORT_PATH = os.path.join(_DOSSIER, "exports")
+    with TestClient(main.app) as c:
+        yield c
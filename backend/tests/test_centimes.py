@@ -0,0 +1,57 @@
+"""Propriétés du mode centimes sur des prêts tirés par hypothesis."""
+from hypothesis import assume, given, settings, strategies as st
+
+import services
+
+montants = st.decimals(min_value=1000, max_value=2000000, places=2).map(float)
+taux = st.decimals(min_value=0, max_value=12, places=2).map(float)
+durees = st.integers(min_value=1, max_value=600)
+
+
+def _verifier(m, n, p, t):
+    echeancier, total_int, total_assu = services.generer_echeancier_centimes(m, n, p, t)
+    capital_c = sum(services.en_centimes(e["capital"]) for e in echeancier)
+    interets_c = sum(services.en_centimes(e["interet"]) for e in echeancier)
+
+    assert len(echeancier) == n
+    assert echeancier[-1]["solde"] == 0
+    assert all(e["solde"] >= 0 for e in echeancier)
+    assert capital_c == services.en_centimes(m)
+    assert interets_c == services.en_centimes(total_int)
+    assert services.en_centimes(total_assu) == n * services.en_centimes(
+        echeancier[0]["assurance"])
+    return echeancier
+
+
+def _derniere_hors_assurance_c(echeancier):
+    derniere = echeancier[-1]
+    return services.en_centimes(derniere["capital"]) + services.en_centimes(derniere["interet"])
+
+
+@settings(max_examples=300, deadline=None)
+@given(montants, taux, durees)
+def test_duree_donnee(montant, taux_annuel, duree):
+    _verifier(*services.resoudre_parametres_centimes(montant, taux_annuel, duree, None))
+
+
+@settings(max_examples=300, deadline=None)
+@given(montants, taux, durees)
+def test_mensualite_donnee_duree_resolue(montant, taux_annuel, duree):
+    # Mensualité saisie au centime : la durée est résolue par excès
+    p_exacte = services.resoudre_parametres_pret(montant, taux_annuel, duree, None)[2]
+    mensualite = round(p_exacte + 0.01, 2)
+    m, n, p, t = services.resoudre_parametres_centimes(montant, taux_annuel, None, mensualite)
+    assume(n <= 601)
+
+    echeancier = _verifier(m, n, p, t)
+    assert _derniere_hors_assurance_c(echeancier) <= services.en_centimes(p)
+
+
+@settings(max_examples=300, deadline=None)
+@given(st.decimals(min_value=50, max_value=10000, places=2).map(float), taux, durees)
+def test_mensualite_donnee_montant_resolu(mensualite, taux_annuel, duree):
+    m, n, p, t = services.resoudre_parametres_centimes(None, taux_annuel, duree, mensualite)
+    assert n == duree
+
+    echeancier = _verifier(m, n, p, t)
+    assert _derniere_hors_assurance_c(echeancier) <= services.en_centimes(p)
@@ -0,0 +1,74 @@
+import pytest
+
+
+def _offre(nom, taux, frais=0, **autres):
+    return {"nom": nom, "taux_annuel": taux, "duree_mois": 240, "frais": frais, **autres}
+
+
+def test_offres_classees_par_critere(client):
+    reponse = client.post("/comparer-offres", json={
+        "montant": 200000,
+        "critere": "cout_total_credit",
+        "offres": [_offre("B", 3.9, 500), _offre("A", 3.1, 1500), _offre("C", 4.4)]
+    })
+    assert reponse.status_code == 200
+    offres = reponse.json()["offres"]
+
+    assert [o["nom"] for o in offres] == ["A", "B", "C"]
+    assert [o["rang"] for o in offres] == [1, 2, 3]
+    couts = [o["cout_total_credit"] for o in offres]
+    assert couts == sorted(couts)
+    assert offres[0]["frais"] == 1500
+
+
+@pytest.mark.parametrize("frais", [200000, 250000])
+def test_frais_superieurs_au_montant_rejetes(client, frais):
+    reponse = client.post("/comparer-offres", json={
+        "montant": 200000,
+        "critere": "cout_total_credit",
+        "offres": [_offre("A", 3.1), _offre("Piège", 0.5, frais)]
+    })
+    assert reponse.status_code == 400
+    assert "Piège" in reponse.json()["detail"]
+
+
+def test_critere_inconnu_rejete(client):
+    reponse = client.post("/comparer-offres", json={
+        "montant": 200000, "critere": "duree", "offres": [_offre("A", 3.1)]})
+    assert reponse.status_code == 422
+
+
+@pytest.mark.parametrize("taux, duree", [(3.5, 240), (0.0, 120), (7.9, 552)])
+def test_valeurs_egales_a_calculer(client, taux, duree):
+    import services
+
+    offre = _offre("A", taux, taux_assurance=0.0)
+    offre["duree_mois"] = duree
+    resultat = client.post("/comparer-offres", json={
+        "montant": 250000, "offres": [offre]}).json()["offres"][0]
+
+    m, n, p, t = services.resoudre_parametres_pret(250000, taux, duree, None)
+    _, total_interets, _ = services.generer_echeancier(m, n, p, t, 0.0)
+    assert resultat["mensualite"] == round(p, 2)
+    assert resultat["total_interets"] == total_interets
+    # Sans frais ni assurance, le TAEG est le taux actuariel nominal
+    assert resultat["taeg"] == pytest.approx(taux, abs=0.001)
+
+
+def test_taeg_augmente_avec_les_frais(client):
+    offres = client.post("/comparer-offres", json={
+        "montant": 200000, "critere": "taeg",
+        "offres": [_offre("Frais", 3.0, 5000, taux_assurance=0.0),
+                   _offre("Sans", 3.0, taux_assurance=0.0)]}).json()["offres"]
+
+    assert [o["nom"] for o in offres] == ["Sans", "Frais"]
+    assert offres[0]["taeg"] == pytest.approx(3.0, abs=0.001)
+    assert offres[1]["taeg"] > 3.2
+
+
+def test_taeg_hors_borne_rejete(client):
+    reponse = client.post("/comparer-offres", json={
+        "montant": 200000,
+        "offres": [_offre("Usure", 3.0, 199999.99, duree_mois=360)]})
+    assert reponse.status_code == 400
+    assert "TAEG" in reponse.json()["detail"]
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import MODULES_LOURDS
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budget absolu d'import de main.py (démarrage à froid d'un worker)
+BUDGET_IMPORT_S = 1.5
+
+
+def _importer_main(**env):
+    script = (
+        "import json, sys, time; t = time.perf_counter(); import main; "
+        "d = time.perf_counter() - t; "
+        f"print(json.dumps([d, [m for m in {MODULES_LOURDS!r} if m in sys.modules], "
+        "main.CREER_SCHEMA]))"
+    )
+    sortie = subprocess.run(
+        [sys.executable, "-c", script], cwd=BACKEND, capture_output=True, text=True,
+        check=True, env={k: v for k, v in dict(os.environ, **env).items() if v is not None})
+    return json.loads(sortie.stdout.strip().splitlines()[-1]), sortie.stdout
+
+
+def test_import_main_dans_le_budget():
+    meilleure = None
+    for _ in range(3):
+        (duree, modules, _), stdout = _importer_main(DATABASE_URL="sqlite:///:memory:")
+        assert modules == []
+        assert "tables créées" not in stdout
+        meilleure = duree if meilleure is None else min(meilleure, duree)
+    assert meilleure < BUDGET_IMPORT_S
+
+
+def test_schema_au_demarrage_par_defaut_sur_sqlite():
+    (_, _, creer), _ = _importer_main(
+        DATABASE_URL="sqlite:///:memory:", CREER_SCHEMA=None)
+    assert creer is True
+
+
+def test_pas_de_schema_au_demarrage_par_defaut_sur_postgresql():
+    pytest.importorskip("psycopg2")
+    (_, _, creer), _ = _importer_main(
+        DATABASE_URL="postgresql://bench@localhost/bench", CREER_SCHEMA=None)
+    assert creer is False
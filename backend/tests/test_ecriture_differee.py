@@ -0,0 +1,88 @@
+import pytest
+
+ECHEANCIER = [
+    {"mois": 1, "mensualite": 510.0, "capital": 500.0, "interet": 10.0,
+     "assurance": 0.0, "solde": 500.0},
+    {"mois": 2, "mensualite": 505.0, "capital": 500.0, "interet": 5.0,
+     "assurance": 0.0, "solde": 0.0},
+]
+PARAMS = {"montant": 1000.0, "taux_annuel": 12.0, "duree_mois": 2, "mensualite": 505.0}
+
+
+@pytest.fixture
+def file_locale(client):
+    import repository
+    from database import SessionLocal
+
+    file = repository.FileEcritureDifferee(SessionLocal, compteur_local=True)
+    yield file
+    file.arreter()
+
+
+def test_sqlite_sans_compteur_local_enregistre_en_synchrone(client):
+    import main
+
+    with main.SessionLocal() as db:
+        assert not main.file_ecriture.accepte(db)
+    reponse = client.post("/calculer", json={
+        "montant": 100000, "taux_annuel": 3.0, "duree_mois": 120})
+    sim_id = reponse.json()["id"]
+    assert sim_id is not None
+    assert client.put(f"/simulations/{sim_id}/increment-export?type=pdf").status_code == 200
+
+
+def test_attendre_une_simulation(file_locale):
+    import models
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        sim_id = file_locale.reserver_id(db)
+        assert file_locale.soumettre(sim_id, PARAMS, ECHEANCIER, 7, operateur_id=3)
+        file_locale.attendre(sim_id)
+        sim = db.get(models.Simulation, sim_id)
+        assert (sim.client_id, sim.operateur_id, sim.mensualite) == (7, 3, 505.0)
+    finally:
+        db.close()
+
+
+def test_collision_d_id_comptee(file_locale):
+    import instrumentation
+    import repository
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        sim_id = file_locale.reserver_id(db)
+        # Un autre processus insère entre-temps et prend le même ID
+        assert repository.save_simulation(db, PARAMS, ECHEANCIER, 1).id == sim_id
+        avant = instrumentation.ECRITURES_PERDUES.valeur
+
+        file_locale.soumettre(sim_id, PARAMS, ECHEANCIER, 1)
+        file_locale.attendre(sim_id)
+    finally:
+        db.close()
+
+    assert instrumentation.ECRITURES_PERDUES.valeur == avant + 1
+    assert "ecriture_differee_echecs_total" in instrumentation.exposer_metriques()
+
+
+def test_calculer_sans_persistance_n_ecrit_rien(client):
+    from sqlalchemy import func, select
+
+    import models
+    from database import SessionLocal
+
+    def compter():
+        with SessionLocal() as db:
+            return (db.scalar(select(func.count()).select_from(models.Simulation)),
+                    db.scalar(select(func.count()).select_from(models.SimulationDetail)))
+
+    avant = compter()
+    reponse = client.post("/calculer", json={
+        "montant": 100000, "taux_annuel": 3.0, "duree_mois": 120, "persist": False})
+
+    assert reponse.status_code == 200
+    assert reponse.json()["id"] is None
+    assert len(reponse.json()["echeancier"]) == 120
+    assert compter() == avant
@@ -0,0 +1,50 @@
+import csv
+import io
+
+
+def test_export_details_trie_avec_assurance(client):
+    ids = []
+    for duree in (24, 12):
+        reponse = client.post("/calculer", json={
+            "montant": 50000, "taux_annuel": 3.0, "duree_mois": duree, "client_id": 42})
+        ids.append(reponse.json()["id"])
+
+    reponse = client.get("/export/details.csv?client_id=42&taille_lot=7")
+    assert reponse.status_code == 200
+    lignes = list(csv.DictReader(io.StringIO(reponse.text)))
+
+    cles = [(int(l["simulation_id"]), int(l["mois"])) for l in lignes]
+    assert cles == sorted(cles)
+    assert {sim_id for sim_id, _ in cles} == set(ids)
+    assert len(lignes) == 36
+    assert all(float(l["assurance"]) == 15.0 for l in lignes)
+
+
+def _export_simulations(client, **filtres):
+    reponse = client.get("/export/simulations.csv", params=filtres)
+    assert reponse.status_code == 200
+    return list(csv.DictReader(io.StringIO(reponse.text)))
+
+
+def test_export_filtre_par_operateur_et_date(client):
+    from datetime import datetime, timedelta
+
+    debut = datetime.utcnow() - timedelta(seconds=1)
+    ids = {}
+    for operateur_id in (5, 6):
+        reponse = client.post("/calculer", json={
+            "montant": 80000, "taux_annuel": 2.5, "duree_mois": 120,
+            "client_id": 77, "operateur_id": operateur_id})
+        ids[operateur_id] = reponse.json()["id"]
+    fin = datetime.utcnow() + timedelta(seconds=1)
+
+    lignes = _export_simulations(client, operateur_id=5)
+    assert [int(l["id"]) for l in lignes] == [ids[5]]
+    assert lignes[0]["operateur_id"] == "5"
+    assert float(lignes[0]["mensualite"]) > 0
+
+    periode = {"client_id": 77, "date_debut": debut.isoformat(),
+               "date_fin": fin.isoformat()}
+    assert {int(l["id"]) for l in _export_simulations(client, **periode)} == set(ids.values())
+    assert _export_simulations(client, client_id=77, date_debut=fin.isoformat()) == []
+    assert _export_simulations(client, client_id=77, date_fin=debut.isoformat()) == []
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+
+def test_tableau_dans_la_largeur_utile():
+    from reportlab.platypus import Table
+
+    import services
+
+    gabarit = services._gabarit_pdf()
+    largeur = gabarit["pagesize"][0]
+    assert gabarit["largeur_utile"] == largeur - 2 * gabarit["marge"]
+    assert sum(gabarit["largeurs_colonnes"]) == pytest.approx(gabarit["largeur_utile"])
+
+    tableau = Table([services.PDF_ENTETE], colWidths=gabarit["largeurs_colonnes"])
+    largeur_tableau, _ = tableau.wrap(gabarit["largeur_utile"], 100)
+    assert largeur_tableau <= gabarit["largeur_utile"] + 1e-6
+
+
+def test_export_pdf(client):
+    calcul = client.post("/calculer", json={
+        "montant": 150000, "taux_annuel": 3.0, "duree_mois": 180, "persist": False}).json()
+    reponse = client.post("/export/pdf/0", json={
+        "echeancier": calcul["echeancier"], "params_finaux": calcul["params_finaux"]})
+
+    assert reponse.status_code == 200
+    assert reponse.content.startswith(b"%PDF")
@@ -0,0 +1,20 @@
+def test_reprise_des_centimes_des_lignes_existantes(client):
+    import init_db
+    import models
+    from database import SessionLocal
+
+    with SessionLocal() as db:
+        ligne = models.SimulationDetail(
+            simulation_id=None, mois=1, mensualite=1123.45, interet=583.33,
+            assurance=60.0, capital_amorti=480.12, solde_restant=199519.88)
+        db.add(ligne)
+        db.commit()
+        ligne_id = ligne.id
+
+    init_db.remplir_centimes_manquants()
+
+    with SessionLocal() as db:
+        ligne = db.get(models.SimulationDetail, ligne_id)
+        assert (ligne.mensualite_centimes, ligne.interet_centimes,
+                ligne.assurance_centimes, ligne.capital_amorti_centimes,
+                ligne.solde_restant_centimes) == (112345, 58333, 6000, 48012, 19951988)
@@ -0,0 +1,78 @@
+import re
+import time
+
+import pytest
+
+
+def _serie(texte, nom, **etiquettes):
+    """Valeur d'une ligne d'exposition Prometheus (0 si absente)."""
+    base = ",".join(f'{k}="{v}"' for k, v in etiquettes.items())
+    motif = re.escape(f"{nom}{{{base}}}") + r" ([0-9.e+-]+)"
+    trouve = re.search(motif, texte)
+    return float(trouve.group(1)) if trouve else 0.0
+
+
+def test_server_timing_et_comptage_sql(client):
+    reponse = client.post("/calculer", json={
+        "montant": 120000, "taux_annuel": 3.1, "duree_mois": 180})
+    entete = reponse.headers["Server-Timing"]
+    assert re.search(r"calcul;dur=[0-9.]+", entete)
+    assert re.search(r"echeancier;dur=[0-9.]+", entete)
+    assert re.search(r"base;dur=[0-9.]+", entete)
+    assert int(re.search(r'desc="(\d+) requetes"', entete).group(1)) > 0
+
+    reponse = client.post("/calculer", json={
+        "montant": 120000, "taux_annuel": 3.1, "duree_mois": 180, "persist": False})
+    assert 'desc="0 requetes"' in reponse.headers["Server-Timing"]
+
+
+def test_metriques_exposees(client):
+    client.post("/calculer", json={
+        "montant": 90000, "taux_annuel": 2.0, "duree_mois": 120, "persist": False})
+    texte = client.get("/metrics").text
+
+    assert "# TYPE http_request_duration_seconds histogram" in texte
+    assert _serie(texte, "http_request_duration_seconds_count",
+                  methode="POST", route="/calculer", statut="200") >= 1
+    assert _serie(texte, "etape_duration_seconds_count", etape="calcul") >= 1
+    assert "# TYPE ecriture_differee_echecs_total counter" in texte
+
+
+def test_latence_http_inclut_le_corps_en_flux():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from starlette.responses import StreamingResponse
+
+    import instrumentation
+
+    app = FastAPI()
+    app.middleware("http")(instrumentation.middleware_chronometrage)
+
+    @app.get("/flux-lent")
+    def flux_lent():
+        def corps():
+            for _ in range(3):
+                time.sleep(0.05)
+                yield b"x"
+        return StreamingResponse(corps())
+
+    with TestClient(app) as c:
+        assert c.get("/flux-lent").content == b"xxx"
+
+    texte = instrumentation.exposer_metriques()
+    somme = _serie(texte, "http_request_duration_seconds_sum",
+                   methode="GET", route="/flux-lent", statut="200")
+    assert somme >= 0.15
+
+
+def test_requete_sql_en_echec_ne_laisse_pas_de_chronometre(client):
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+
+    from database import engine
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM table_inexistante"))
+        assert conn.info.get("debuts_requetes", []) == []
@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture
+def profilage(client, monkeypatch):
+    import instrumentation
+
+    monkeypatch.setattr(instrumentation, "PROFILAGE_ACTIF", True)
+    instrumentation.PROFILS.clear()
+    return instrumentation.PROFILS
+
+
+def test_profil_inclut_le_rendu_pdf_du_pool(client, profilage):
+    calcul = client.post("/calculer", json={
+        "montant": 300000, "taux_annuel": 3.0, "duree_mois": 600, "persist": False}).json()
+
+    reponse = client.post("/export/pdf/0", json=calcul["echeancier"],
+                          headers={"X-Profilage": "1"})
+    assert reponse.status_code == 200
+
+    profil = profilage[-1]
+    assert profil["route"] == "/export/pdf/{simulation_id}"
+    assert "portee" in profil
+    piles_travail = [p for p in profil["piles"] if p.startswith("travail;")]
+    assert any("sauvegarder_pdf_localement" in p for p in piles_travail)
+
+
+def test_profil_couvre_le_flux_d_export(client, profilage):
+    for _ in range(3):
+        client.post("/calculer", json={"montant": 200000, "taux_annuel": 3.5,
+                                       "duree_mois": 300})
+
+    reponse = client.get("/export/details.csv", headers={"X-Profilage": "1"})
+    assert reponse.status_code == 200
+
+    # Le profil n'est enregistré qu'après le dernier octet du flux
+    profil = profilage[-1]
+    assert profil["route"] == "/export/{table}.{format}"
+    assert all(p.split(";", 1)[0] in ("boucle", "travail") for p in profil["piles"])
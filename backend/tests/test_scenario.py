@@ -0,0 +1,118 @@
+import pytest
+
+
+def _simulation(client, **donnees):
+    reponse = client.post("/calculer", json=donnees)
+    assert reponse.status_code == 200
+    return reponse.json()
+
+
+def _scenario(client, sim_id, evenements):
+    return client.post(f"/simulation/{sim_id}/scenario", json={"evenements": evenements})
+
+
+@pytest.mark.parametrize("donnees", [
+    {"montant": 200000, "taux_annuel": 3.5, "mensualite": 1500},
+    {"montant": 350000, "taux_annuel": 4.2, "mensualite": 2100},
+    {"taux_annuel": 2.1, "duree_mois": 180, "mensualite": 900},
+])
+def test_scenario_neutre_sans_ecart(client, donnees):
+    """Reprendre la mensualité saisie ne change ni le préfixe ni les totaux."""
+    sim = _simulation(client, **donnees)
+    p = sim["params_finaux"]["mensualite"]
+
+    reponse = _scenario(client, sim["id"], [
+        {"type": "modification_mensualite", "mois": 100, "mensualite": p}])
+    assert reponse.status_code == 200
+    resultat = reponse.json()
+
+    assert resultat["echeancier"][:99] == sim["echeancier"][:99]
+    assert resultat["delta_interets"] == 0
+    assert resultat["delta_duree_mois"] == 0
+    assert resultat["total_interets"] == sim["params_finaux"]["total_interets"]
+
+
+def test_remboursement_anticipe_reduit_interets_et_duree(client):
+    sim = _simulation(client, montant=200000, taux_annuel=3.5, duree_mois=240)
+    resultat = _scenario(client, sim["id"], [
+        {"type": "remboursement_anticipe", "mois": 84, "montant": 20000}]).json()
+
+    assert resultat["echeancier"][:83] == sim["echeancier"][:83]
+    assert resultat["delta_interets"] < 0
+    assert resultat["delta_duree_mois"] < 0
+    assert resultat["echeancier"][-1]["solde"] == 0
+
+
+def test_evenement_invalide_rejete(client):
+    sim = _simulation(client, montant=100000, taux_annuel=3, duree_mois=120)
+    assert _scenario(client, sim["id"], [
+        {"type": "remboursement_anticipe", "mois": 10, "montant": 500,
+         "mode": "duree_typo"}]).status_code == 422
+    assert _scenario(client, sim["id"], [
+        {"type": "inconnu", "mois": 10}]).status_code == 422
+    assert _scenario(client, sim["id"], [
+        {"type": "renegociation_taux", "mois": 500, "taux_annuel": 2}]).status_code == 400
+
+
+def _capital_total(echeancier):
+    return round(sum(ligne["capital"] for ligne in echeancier), 2)
+
+
+def test_remboursement_total_solde_le_pret(client):
+    sim = _simulation(client, montant=100000, taux_annuel=3, duree_mois=120)
+    solde = sim["echeancier"][58]["solde"]
+    resultat = _scenario(client, sim["id"], [
+        {"type": "remboursement_anticipe", "mois": 60, "montant": 10**7}]).json()
+
+    echeancier = resultat["echeancier"]
+    assert resultat["duree_mois"] == 60
+    assert echeancier[:59] == sim["echeancier"][:59]
+    assert echeancier[-1]["mois"] == 60
+    assert echeancier[-1]["capital"] == solde
+    assert echeancier[-1]["interet"] == 0
+    assert echeancier[-1]["solde"] == 0
+    assert _capital_total(echeancier) == 100000
+    assert resultat["delta_duree_mois"] == -60
+
+
+def test_remboursement_partiel_compte_dans_le_capital(client):
+    sim = _simulation(client, montant=100000, taux_annuel=3, duree_mois=120)
+    resultat = _scenario(client, sim["id"], [
+        {"type": "remboursement_anticipe", "mois": 30, "montant": 15000,
+         "mode": "mensualite"}]).json()
+
+    echeancier = resultat["echeancier"]
+    assert resultat["duree_mois"] == 120
+    assert echeancier[29]["capital"] > 15000
+    assert echeancier[30]["mensualite"] < sim["echeancier"][30]["mensualite"]
+    assert _capital_total(echeancier) == 100000
+    assert echeancier[-1]["solde"] == 0
+
+
+def test_renegociation_taux(client):
+    sim = _simulation(client, montant=200000, taux_annuel=4, duree_mois=240)
+    resultat = _scenario(client, sim["id"], [
+        {"type": "renegociation_taux", "mois": 61, "taux_annuel": 2.5}]).json()
+
+    echeancier = resultat["echeancier"]
+    assert echeancier[:60] == sim["echeancier"][:60]
+    assert resultat["duree_mois"] == 240
+    assert echeancier[60]["mensualite"] < sim["echeancier"][60]["mensualite"]
+    assert resultat["delta_interets"] < 0
+    assert _capital_total(echeancier) == 200000
+    assert echeancier[-1]["solde"] == 0
+
+
+def test_modification_duree(client):
+    sim = _simulation(client, montant=150000, taux_annuel=3.2, duree_mois=180)
+    resultat = _scenario(client, sim["id"], [
+        {"type": "modification_duree", "mois": 37, "duree_mois": 240}]).json()
+
+    echeancier = resultat["echeancier"]
+    assert echeancier[:36] == sim["echeancier"][:36]
+    assert resultat["duree_mois"] == 240
+    assert resultat["delta_duree_mois"] == 60
+    assert echeancier[36]["mensualite"] < sim["echeancier"][36]["mensualite"]
+    assert resultat["delta_interets"] > 0
+    assert _capital_total(echeancier) == 150000
+    assert echeancier[-1]["solde"] == 0